@@ -4,7 +4,7 @@ import logging
 
 from .command_metrics import CommandMetrics
 from .pool_metrics import PoolMetrics
-from .pool import Pool
+from .pool import Pool, shutdown
 from .command import Command
 from .group import Group
 
@@ -0,0 +1,139 @@
+""" CPU affinity helpers used by :class:`hystrix.pool.Pool` to pin worker
+processes to a set of CPUs.
+
+Pinning is only supported where :func:`os.sched_setaffinity` is available
+(Linux), on other platforms pinning is a no-op and a warning is logged.
+"""
+from __future__ import absolute_import
+import itertools
+import logging
+import glob
+import os
+import re
+
+log = logging.getLogger(__name__)
+
+#: Pass as ``cpu_affinity`` to spread pools across NUMA nodes.
+NUMA = 'numa'
+
+_NODE_CPULIST = '/sys/devices/system/node/node*/cpulist'
+
+
+def parse_cpu_list(cpulist):
+    """ Parse a Linux CPU list string (such as ``0-3,8,10-11``).
+
+    Args:
+        cpulist (str): CPU list as found in ``/sys`` or ``taskset``.
+
+    Returns:
+        set: CPU ids in the list.
+    """
+    cpus = set()
+    for part in cpulist.strip().split(','):
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-')
+            cpus.update(range(int(start), int(end) + 1))
+        else:
+            cpus.add(int(part))
+    return cpus
+
+
+def available_cpus():
+    """ CPUs the current process is allowed to run on.
+
+    Returns:
+        frozenset: CPU ids.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return frozenset(os.sched_getaffinity(0))
+    return frozenset(range(os.cpu_count() or 1))
+
+
+def numa_nodes():
+    """ CPUs of each NUMA node, restricted to :func:`available_cpus`.
+
+    Falls back to a single node holding every available CPU when the NUMA
+    topology can't be read.
+
+    Returns:
+        list: A :class:`frozenset` of CPU ids per NUMA node, ordered by node
+            number.
+    """
+    available = available_cpus()
+
+    def node_number(path):
+        return int(re.search(r'node(\d+)', path).group(1))
+
+    nodes = []
+    for path in sorted(glob.glob(_NODE_CPULIST), key=node_number):
+        try:
+            with open(path) as cpulist:
+                cpus = frozenset(parse_cpu_list(cpulist.read())) & available
+        except (IOError, OSError, ValueError):
+            continue
+        if cpus:
+            nodes.append(cpus)
+
+    return nodes or [available]
+
+
+class NodeAllocator(object):
+    """ Hands out NUMA nodes round-robin so consecutive pools land on
+    different nodes.
+    """
+
+    def __init__(self, nodes=None):
+        self.nodes = nodes if nodes is not None else numa_nodes()
+        self._next = itertools.count()
+
+    def allocate(self):
+        """ CPUs of the next NUMA node.
+
+        Returns:
+            frozenset: CPU ids.
+        """
+        return self.nodes[next(self._next) % len(self.nodes)]
+
+
+_allocator = None
+
+
+def cpus_for(cpu_affinity):
+    """ Resolve a ``cpu_affinity`` value into a set of CPU ids.
+
+    Args:
+        cpu_affinity: :data:`NUMA` to take the next NUMA node or an iterable
+            of CPU ids.
+
+    Returns:
+        frozenset: CPU ids.
+    """
+    global _allocator
+
+    if cpu_affinity == NUMA:
+        if _allocator is None:
+            _allocator = NodeAllocator()
+        return _allocator.allocate()
+
+    cpus = frozenset(cpu_affinity)
+    if not cpus:
+        raise ValueError('cpu_affinity must hold at least one CPU.')
+    return cpus
+
+
+def pin(cpus):
+    """ Pin the calling process to ``cpus``.
+
+    Used as a :class:`concurrent.futures.ProcessPoolExecutor` initializer so
+    it must stay a module level function.
+
+    Args:
+        cpus (frozenset): CPU ids.
+    """
+    if not hasattr(os, 'sched_setaffinity'):
+        log.warning('CPU affinity is not supported on this platform.')
+        return
+
+    os.sched_setaffinity(0, cpus)
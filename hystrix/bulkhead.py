@@ -0,0 +1,203 @@
+""" Bulkhead isolation for :mod:`asyncio` code.
+
+Limits how many coroutines of a group run at the same time without leaving
+the event loop, unlike :class:`hystrix.pool.Pool` which hops to a separate
+worker for every execution.
+
+Requires Python 3.5 or later for ``async def``, unlike the rest of the
+package the module can't be imported on older versions.
+"""
+from __future__ import absolute_import
+import asyncio
+import logging
+
+from hystrix.rolling_number import RollingNumber, RollingNumberEvent
+from hystrix.command_properties import CommandProperties
+
+log = logging.getLogger(__name__)
+
+
+class BulkheadRejectedError(RuntimeError):
+    """ Raised when a :class:`Bulkhead` has no capacity left or the wait for
+    a slot timed out.
+    """
+
+
+class Bulkhead(object):
+    """ Limit concurrent coroutine executions with a bounded wait queue.
+
+    Up to ``max_concurrent`` executions run at once, up to ``max_queue_size``
+    more wait (at most ``queue_timeout`` seconds) for a slot and everything
+    beyond is rejected with :class:`BulkheadRejectedError`.
+
+    Rejections are recorded as ``THREAD_POOL_REJECTED``, or as
+    ``SEMAPHORE_REJECTED`` when there is no wait queue, matching the
+    isolation the bulkhead behaves like.
+
+    Example::
+
+        >>> bulkhead = Bulkhead.get_instance('UserGroup', max_concurrent=10)
+        >>> user = await bulkhead.call(fetch_user, user_id)
+
+        >>> async with bulkhead:
+        ...     user = await fetch_user(user_id)
+
+    Args:
+        group_key (str): Group name.
+        max_concurrent (int): Executions allowed to run at the same time.
+        max_queue_size (int): Executions allowed to wait for a slot.
+        queue_timeout (float): Seconds an execution waits for a slot,
+            ``None`` waits forever.
+        counter (:class:`hystrix.rolling_number.RollingNumber`): Counter the
+            statistics are recorded on.
+    """
+
+    __instances__ = dict()
+
+    def __init__(self, group_key, max_concurrent=10, max_queue_size=5,
+                 queue_timeout=None, counter=None):
+        if max_concurrent <= 0:
+            raise ValueError('max_concurrent must be greater than 0')
+
+        self.group_key = group_key
+        self.max_concurrent = max_concurrent
+        self.max_queue_size = max_queue_size
+        self.queue_timeout = queue_timeout
+        self.counter = counter or RollingNumber(
+            CommandProperties.default_metrics_rolling_statistical_window,
+            CommandProperties.default_metrics_rolling_statistical_window_buckets)
+
+        if max_queue_size > 0:
+            self.rejection_event = RollingNumberEvent.THREAD_POOL_REJECTED
+        else:
+            self.rejection_event = RollingNumberEvent.SEMAPHORE_REJECTED
+
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._active = 0
+        self._waiting = 0
+        self._completed = 0
+
+    @classmethod
+    def get_instance(klass, group_key, **kwargs):
+        """ Return the :class:`Bulkhead` of ``group_key``, creating it with
+        ``kwargs`` on first use.
+        """
+        if group_key not in klass.__instances__:
+            klass.__instances__[group_key] = klass(group_key, **kwargs)
+        return klass.__instances__[group_key]
+
+    async def acquire(self):
+        """ Wait for an execution slot.
+
+        Raises:
+            BulkheadRejectedError: The wait queue is full or the wait timed
+                out.
+        """
+        if self._semaphore.locked() and \
+                self._waiting >= self.max_queue_size:
+            self._reject('{} is full'.format(self.group_key))
+
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(),
+                                   self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._reject('{} wait timed out'.format(self.group_key))
+        finally:
+            self._waiting -= 1
+
+        self._active += 1
+        self.counter.increment(RollingNumberEvent.THREAD_EXECUTION)
+        self.counter.update_rolling_max(RollingNumberEvent.THREAD_MAX_ACTIVE,
+                                        self._active)
+
+    def release(self):
+        """ Give back the slot taken by :meth:`acquire`. """
+        self._active -= 1
+        self._completed += 1
+        self._semaphore.release()
+
+    async def call(self, fn, *args, **kwargs):
+        """ Await ``fn(*args, **kwargs)`` inside the bulkhead.
+
+        Raises:
+            BulkheadRejectedError: No slot could be taken.
+        """
+        async with self:
+            return await fn(*args, **kwargs)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+    def _reject(self, message):
+        self.counter.increment(self.rejection_event)
+        raise BulkheadRejectedError(message)
+
+    def current_active_count(self):
+        """ Executions currently running.
+
+        Returns:
+            int: Active count.
+        """
+        return self._active
+
+    def current_queue_size(self):
+        """ Executions currently waiting for a slot.
+
+        Returns:
+            int: Queue size.
+        """
+        return self._waiting
+
+    def current_pool_size(self):
+        """ Maximum executions allowed to run at the same time.
+
+        Returns:
+            int: Pool size.
+        """
+        return self.max_concurrent
+
+    def current_completed_task_count(self):
+        """ Executions completed since the bulkhead was created.
+
+        Returns:
+            int: Completed count.
+        """
+        return self._completed
+
+    def rolling_count_executed(self):
+        """ Executions started during the rolling window.
+
+        Returns:
+            int: Executed count.
+        """
+        return self.counter.rolling_sum(RollingNumberEvent.THREAD_EXECUTION)
+
+    def cumulative_count_executed(self):
+        """ Executions started since the bulkhead was created.
+
+        Returns:
+            int: Executed count.
+        """
+        return self.counter.cumulative_sum(
+            RollingNumberEvent.THREAD_EXECUTION)
+
+    def rolling_count_rejected(self):
+        """ Executions rejected during the rolling window.
+
+        Returns:
+            int: Rejected count.
+        """
+        return self.counter.rolling_sum(self.rejection_event)
+
+    def rolling_max_active(self):
+        """ Highest concurrency seen during the rolling window.
+
+        Returns:
+            int: Max active count.
+        """
+        return self.counter.rolling_max(RollingNumberEvent.THREAD_MAX_ACTIVE)
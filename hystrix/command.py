@@ -5,6 +5,7 @@ tolerance, statistics and performance metrics capture, circuit breaker and
 bulkhead functionality.
 """
 from __future__ import absolute_import
+from concurrent.futures import Future
 import logging
 
 import six
@@ -49,10 +50,14 @@ class CommandMetaclass(type):
         # changed at runtime.
         pool_key = attrs.get('pool_key')
 
+        # Pool class, defaults to :class:`hystrix.pool.Pool`.
+        pool_class = attrs.get('pool_class')
+
         # Group key initialization
         group_key = attrs.get('group_key') or '{}Group'.format(command_key)
         NewGroup = type(group_key, (Group,),
-                        dict(group_key=group_key, pool_key=pool_key))
+                        dict(group_key=group_key, pool_key=pool_key,
+                             pool_class=pool_class))
 
         setattr(new_class, 'group', NewGroup())
         setattr(new_class, 'group_key', group_key)
@@ -67,7 +72,10 @@ class CommandMetaclass(type):
                 command_metrics_key, (CommandMetrics,),
                 dict(command_metrics_key=command_metrics_key,
                      group_key=group_key, pool_key=pool_key))
-            metrics = NewCommandMetrics(properties=properties_strategy)
+            # Custom events recorded by the command, see
+            # :meth:`hystrix.rolling_number.RollingNumberEvent.extend`.
+            metrics = NewCommandMetrics(properties=properties_strategy,
+                                        events=attrs.get('events'))
 
         setattr(new_class, 'metrics', metrics)
 
@@ -99,7 +107,7 @@ class Command(six.with_metaclass(CommandMetaclass, object)):
 
     def execute(self, timeout=None):
         timeout = timeout or self.timeout
-        future = self.group.pool.submit(self.run)
+        future = self.__submit(self.run)
         try:
             return future.result(timeout)
         except Exception:
@@ -107,13 +115,13 @@ class Command(six.with_metaclass(CommandMetaclass, object)):
             log.info('run raises {}'.format(future.exception))
             try:
                 log.info('trying fallback for {}'.format(self))
-                future = self.group.pool.submit(self.fallback)
+                future = self.__submit(self.fallback, inline=True)
                 return future.result(timeout)
             except Exception:
                 log.exception('exception calling fallback for {}'.format(self))
                 log.info('run() raised {}'.format(future.exception))
                 log.info('trying cache for {}'.format(self))
-                future = self.group.pool.submit(self.cache)
+                future = self.__submit(self.cache, inline=True)
                 return future.result(timeout)
 
     def observe(self, timeout=None):
@@ -126,7 +134,7 @@ class Command(six.with_metaclass(CommandMetaclass, object)):
 
     def __async(self, timeout=None):
         timeout = timeout or self.timeout
-        future = self.group.pool.submit(self.run)
+        future = self.__submit(self.run)
         try:
             # Call result() to check for exception
             future.result(timeout)
@@ -136,7 +144,7 @@ class Command(six.with_metaclass(CommandMetaclass, object)):
             log.info('run raised {}'.format(future.exception))
             try:
                 log.info('trying fallback for {}'.format(self))
-                future = self.group.pool.submit(self.fallback)
+                future = self.__submit(self.fallback, inline=True)
                 # Call result() to check for exception
                 future.result(timeout)
                 return future
@@ -144,4 +152,27 @@ class Command(six.with_metaclass(CommandMetaclass, object)):
                 log.exception('exception calling fallback for {}'.format(self))
                 log.info('fallback raised {}'.format(future.exception))
                 log.info('trying cache for {}'.format(self))
-                return self.group.pool.submit(self.cache)
+                return self.__submit(self.cache, inline=True)
+
+    def __submit(self, fn, inline=False):
+        """ Submit ``fn`` to the group pool.
+
+        Once the pool stops accepting work (see :func:`hystrix.pool.shutdown`)
+        the returned future holds the rejection, or with ``inline`` the
+        result of calling ``fn`` on the current thread so in-flight commands
+        can still fall back.
+        """
+        try:
+            return self.group.pool.submit(fn)
+        except RuntimeError as rejection:
+            log.info('{} rejected {}'.format(self.group.pool_key, self))
+            future = Future()
+            if not inline:
+                future.set_exception(rejection)
+                return future
+
+            try:
+                future.set_result(fn())
+            except Exception as exception:
+                future.set_exception(exception)
+            return future
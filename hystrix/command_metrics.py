@@ -8,10 +8,17 @@ from atomos.multiprocessing.atomic import AtomicLong
 from hystrix.metrics import Metrics
 from hystrix.event_type import EventType
 from hystrix.rolling_number import (RollingNumber, RollingNumberEvent,
-                                    ActualTime)
+                                    MonotonicTime)
 
 log = logging.getLogger(__name__)
 
+# Events read by :meth:`CommandMetrics.health_counts`
+HEALTH_EVENTS = (RollingNumberEvent.SUCCESS, RollingNumberEvent.FAILURE,
+                 RollingNumberEvent.TIMEOUT,
+                 RollingNumberEvent.THREAD_POOL_REJECTED,
+                 RollingNumberEvent.SEMAPHORE_REJECTED,
+                 RollingNumberEvent.SHORT_CIRCUITED)
+
 
 class CommandMetricsMetaclass(type):
     """ Metaclass for :class:`CommandMetrics`
@@ -51,18 +58,34 @@ class CommandMetricsMetaclass(type):
 
 class CommandMetrics(six.with_metaclass(CommandMetricsMetaclass, Metrics)):
     """ Used by :class:`hystrix.command.Command` to record metrics.
+
+    Args:
+        counter: Counter the metrics are recorded on, such as a
+            :class:`hystrix.metrics_matrix.MatrixRollingNumber`. Defaults to a
+            :class:`hystrix.rolling_number.RollingNumber` sized by
+            ``properties``.
+        events: Events class of the default counter, see
+            :meth:`hystrix.rolling_number.RollingNumberEvent.extend`. Pass
+            it to the ``counter`` instead when giving one.
     """
     command_metrics_key = None
 
     # TODO: Review default value None here
     def __init__(self, command_metrics_key=None, group_key=None,
-                 pool_key=None, properties=None, event_notifier=None):
-        counter = RollingNumber(
-            properties.metrics_rolling_statistical_window_in_milliseconds(),
-            properties.metrics_rolling_statistical_window_buckets())
+                 pool_key=None, properties=None, event_notifier=None,
+                 counter=None, events=None):
+        if counter is not None and events is not None:
+            raise ValueError('events only applies to the default counter, '
+                             'create the counter with them instead.')
+
+        if counter is None:
+            counter = RollingNumber(
+                properties.metrics_rolling_statistical_window_in_milliseconds(),
+                properties.metrics_rolling_statistical_window_buckets(),
+                events=events)
         super(CommandMetrics, self).__init__(counter)
         self.properties = properties
-        self.actual_time = ActualTime()
+        self.actual_time = MonotonicTime()
         self.group_key = group_key
         self.event_notifier = event_notifier
         self.health_counts_snapshot = None
@@ -131,6 +154,32 @@ class CommandMetrics(six.with_metaclass(CommandMetricsMetaclass, Metrics)):
         self.event_notifier.mark_event(EventType.BAD_REQUEST, self.command_metrics_key)
         self.counter.increment(RollingNumberEvent.BAD_REQUEST)
 
+    def mark_events(self, counts):
+        """ Mark many events at once incrementing counters and emiting
+        events
+
+        Used by collapsed and bulk executions that produce many outcomes at
+        once, the counters are updated in a single
+        :meth:`hystrix.rolling_number.RollingNumber.record_many` call.
+
+            >>> metrics.mark_events({EventType.SUCCESS: 98,
+            ...                      EventType.TIMEOUT: 2})
+
+        Args:
+            counts (dict): Number of occurrences keyed by
+                :class:`hystrix.event_type.EventType`.
+        """
+        values = {}
+        for event_type, count in counts.items():
+            for _ in range(count):
+                self.event_notifier.mark_event(event_type,
+                                               self.command_metrics_key)
+            event = getattr(RollingNumberEvent, event_type.name, None)
+            if event is not None:
+                values[event] = count
+
+        self.counter.record_many(values)
+
     def health_counts(self):
         """ Health counts
 
@@ -142,18 +191,19 @@ class CommandMetrics(six.with_metaclass(CommandMetricsMetaclass, Metrics)):
         # we put an interval between snapshots so high-volume commands don't
         # spend too much unnecessary time calculating metrics in very small time periods
         last_time = self.last_health_counts_snapshot.get()
-        current_time = ActualTime().current_time_in_millis()
+        current_time = self.actual_time.current_time_in_millis()
         if (current_time - last_time) >= self.properties.metrics_health_snapshot_interval_in_milliseconds() or self.health_counts_snapshot is None:
             if self.last_health_counts_snapshot.compare_and_set(last_time, current_time):
                 # Our thread won setting the snapshot time so we will
                 # proceed with generating a new snapshot
                 # losing threads will continue using the old snapshot
-                success = self.counter.rolling_sum(RollingNumberEvent.SUCCESS)
-                failure = self.counter.rolling_sum(RollingNumberEvent.FAILURE)
-                timeout = self.counter.rolling_sum(RollingNumberEvent.TIMEOUT)
-                thread_pool_rejected = self.counter.rolling_sum(RollingNumberEvent.THREAD_POOL_REJECTED)
-                semaphore_rejected = self.counter.rolling_sum(RollingNumberEvent.SEMAPHORE_REJECTED)
-                short_circuited = self.counter.rolling_sum(RollingNumberEvent.SHORT_CIRCUITED)
+                snapshot = self.counter.snapshot(HEALTH_EVENTS)
+                success = snapshot.rolling_sum(RollingNumberEvent.SUCCESS)
+                failure = snapshot.rolling_sum(RollingNumberEvent.FAILURE)
+                timeout = snapshot.rolling_sum(RollingNumberEvent.TIMEOUT)
+                thread_pool_rejected = snapshot.rolling_sum(RollingNumberEvent.THREAD_POOL_REJECTED)
+                semaphore_rejected = snapshot.rolling_sum(RollingNumberEvent.SEMAPHORE_REJECTED)
+                short_circuited = snapshot.rolling_sum(RollingNumberEvent.SHORT_CIRCUITED)
                 total_count = failure + success + timeout + thread_pool_rejected + short_circuited + semaphore_rejected
                 error_count = failure + timeout + thread_pool_rejected + short_circuited + semaphore_rejected
                 error_percentage = 0
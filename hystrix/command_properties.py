@@ -74,6 +74,10 @@ class CommandProperties(object):
     # Default to 100 values max per bucket
     default_metrics_rolling_percentile_bucket_size = 100
 
+    # Default to latencies recorded in milliseconds, see
+    # :data:`hystrix.rolling_percentile.UNITS`
+    default_metrics_rolling_percentile_unit = 'milliseconds'
+
     # Default to 500ms as max frequency between allowing snapshots of health
     # (error percentage etc)
     default_metrics_health_snapshot_interval_in_milliseconds = 500
@@ -233,6 +237,15 @@ class CommandProperties(object):
                 self.default_metrics_rolling_percentile_bucket_size,
                 setter.metrics_rolling_percentile_bucket_size())
 
+        # Unit of the latencies stored in
+        # :class:`hystrix.rolling_percentile.RollingPercentile`
+        self._metrics_rolling_percentile_unit = \
+            self._property(
+                self.property_prefix, self.command_key,
+                'metrics.rolling_percentile.unit',
+                self.default_metrics_rolling_percentile_unit,
+                setter.metrics_rolling_percentile_unit())
+
         # Time between health snapshots
         self._metrics_health_snapshot_interval_in_milliseconds = \
             self._property(
@@ -450,6 +463,16 @@ class CommandProperties(object):
         """
         return self._metrics_rolling_percentile_enabled
 
+    def metrics_rolling_percentile_unit(self):
+        """ Unit latencies are recorded in by :class:`hystrix.RollingPercentile`,
+        ``milliseconds``, ``microseconds`` or ``nanoseconds``. Sub-millisecond
+        commands need a finer unit than the default milliseconds.
+
+        Returns:
+            str: Unit
+        """
+        return self._metrics_rolling_percentile_unit
+
     def metrics_rolling_percentile_window_in_milliseconds(self):
         """ Duration of percentile rolling window in milliseconds. This is
         passed into :class:`hystrix.RollingPercentile` inside
@@ -554,6 +577,7 @@ class CommandProperties(object):
             self._metrics_health_snapshot_interval_in_milliseconds = None
             self._metrics_rolling_percentile_bucket_size = None
             self._metrics_rolling_percentile_enabled = None
+            self._metrics_rolling_percentile_unit = None
             self._metrics_rolling_percentile_window_in_milliseconds = None
             self._metrics_rolling_percentile_window_buckets = None
             self._metrics_rolling_statistical_window_in_milliseconds = None
@@ -606,6 +630,9 @@ class CommandProperties(object):
         def metrics_rolling_percentile_enabled(self):
             return self._metrics_rolling_percentile_enabled
 
+        def metrics_rolling_percentile_unit(self):
+            return self._metrics_rolling_percentile_unit
+
         def metrics_rolling_percentile_window_in_milliseconds(self):
             return self._metrics_rolling_percentile_window_in_milliseconds
 
@@ -684,6 +711,10 @@ class CommandProperties(object):
             self._metrics_rolling_percentile_enabled = value
             return self
 
+        def with_metrics_rolling_percentile_unit(self, value):
+            self._metrics_rolling_percentile_unit = value
+            return self
+
         def with_metrics_rolling_percentile_window_in_milliseconds(self, value):
             self._metrics_rolling_percentile_window_in_milliseconds = value
             return self
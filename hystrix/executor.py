@@ -0,0 +1,183 @@
+""" Executors used by :mod:`hystrix.pool`. """
+from __future__ import absolute_import
+from concurrent.futures import Executor, Future
+from collections import deque
+import itertools
+import threading
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class _WorkItem(object):
+
+    __slots__ = ('future', 'fn', 'args', 'kwargs')
+
+    def __init__(self, future, fn, args, kwargs):
+        self.future = future
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+
+    def run(self):
+        if not self.future.set_running_or_notify_cancel():
+            return
+
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+        except BaseException as exception:
+            self.future.set_exception(exception)
+        else:
+            self.future.set_result(result)
+
+
+class WorkStealingExecutor(Executor):
+    """ Thread executor where every worker owns a deque of work items.
+
+    Submissions are spread round-robin over the worker deques without taking
+    a lock, :meth:`collections.deque.append` and
+    :meth:`collections.deque.popleft` are atomic. A worker runs its own items
+    in submission order and, once its deque is empty, steals the oldest item
+    from the other workers, so a long running item only delays the items
+    queued behind it until an idle worker steals them.
+
+    Idle workers park on their own :class:`threading.Event` and are woken by
+    :meth:`submit`, the wait is bounded by :attr:`idle_timeout` seconds as a
+    safety net.
+
+    :meth:`submit` checks for :meth:`shutdown` again once its item is
+    queued and takes the item back if it lands after it, raising
+    :class:`RuntimeError`. Workers look at the deques once more after
+    seeing the shutdown, so every accepted item is either run or cancelled.
+
+    Args:
+        max_workers (int): Number of worker threads.
+    """
+
+    idle_timeout = 0.1
+
+    def __init__(self, max_workers=5):
+        if max_workers <= 0:
+            raise ValueError('max_workers must be greater than 0')
+
+        self._max_workers = max_workers
+        self._queues = [deque() for _ in range(max_workers)]
+        self._wakeups = [threading.Event() for _ in range(max_workers)]
+        self._idle = deque()
+        self._next = itertools.count()
+        self._shutdown = False
+        self._threads = []
+
+        for index in range(max_workers):
+            thread = threading.Thread(target=self._work, args=(index,),
+                                      name='{}-{}'.format(
+                                          type(self).__name__, index))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, fn, *args, **kwargs):
+        if self._shutdown:
+            raise RuntimeError('cannot schedule new futures after shutdown')
+
+        future = Future()
+        item = _WorkItem(future, fn, args, kwargs)
+        index = next(self._next) % self._max_workers
+        queue = self._queues[index]
+        queue.append(item)
+
+        # Shut down meanwhile, workers may have stopped before seeing the
+        # item. It is taken back unless a worker or shutdown() took it.
+        if self._shutdown:
+            try:
+                queue.remove(item)
+            except ValueError:
+                pass
+            else:
+                raise RuntimeError('cannot schedule new futures after '
+                                   'shutdown')
+
+        self._wake(index)
+        return future
+
+    def _wake(self, index):
+        # Wake the owner if it is parked, otherwise any parked worker so it
+        # can steal the item.
+        try:
+            self._idle.remove(index)
+        except ValueError:
+            try:
+                index = self._idle.popleft()
+            except IndexError:
+                return
+        self._wakeups[index].set()
+
+    def _next_item(self, index):
+        try:
+            return self._queues[index].popleft()
+        except IndexError:
+            pass
+
+        for offset in range(1, self._max_workers):
+            victim = self._queues[(index + offset) % self._max_workers]
+            try:
+                return victim.popleft()
+            except IndexError:
+                continue
+
+        return None
+
+    def _work(self, index):
+        wakeup = self._wakeups[index]
+        while True:
+            item = self._next_item(index)
+            if item is not None:
+                item.run()
+                del item
+                continue
+
+            if self._shutdown:
+                # Items are all queued before the flag is set, queues found
+                # empty after seeing it stay empty.
+                item = self._next_item(index)
+                if item is None:
+                    return
+                item.run()
+                del item
+                continue
+
+            # Announce as idle before checking the queues one last time so
+            # a concurrent submit either sees us idle or we see its item.
+            wakeup.clear()
+            self._idle.append(index)
+            item = self._next_item(index)
+            if item is None and not self._shutdown:
+                wakeup.wait(self.idle_timeout)
+
+            try:
+                self._idle.remove(index)
+            except ValueError:
+                pass
+
+            if item is not None:
+                item.run()
+                del item
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self._shutdown = True
+
+        if cancel_futures:
+            for queue in self._queues:
+                while True:
+                    try:
+                        item = queue.popleft()
+                    except IndexError:
+                        break
+                    item.future.cancel()
+
+        for wakeup in self._wakeups:
+            wakeup.set()
+
+        if wait:
+            for thread in self._threads:
+                thread.join()
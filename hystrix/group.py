@@ -23,7 +23,8 @@ class GroupMetaclass(type):
                                                        bases, attrs)
 
         pool_key = attrs.get('poll_key') or '{}Pool'.format(group_key)
-        NewPool = type(pool_key, (Pool,),
+        pool_class = attrs.get('pool_class') or Pool
+        NewPool = type(pool_key, (pool_class,),
                        dict(pool_key=pool_key))
 
         setattr(new_class, 'pool', NewPool())
@@ -40,3 +41,4 @@ class Group(six.with_metaclass(GroupMetaclass, object)):
 
     group_key = None
     pool_key = None
+    pool_class = None
@@ -0,0 +1,423 @@
+""" Rolling counters of many commands in a single NumPy array.
+
+Requires `NumPy <http://www.numpy.org/>`_, install it with the ``numpy``
+extra::
+
+    pip install hystrix-py[numpy]
+"""
+from __future__ import absolute_import
+from threading import RLock
+from array import array
+import logging
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+from six.moves._thread import get_ident
+
+from hystrix.rolling_number import (RollingNumberEvent, RollingNumberSnapshot,
+                                    MonotonicTime)
+from hystrix.command_metrics import HEALTH_EVENTS, HealthCounts
+
+log = logging.getLogger(__name__)
+
+
+class MetricsMatrix(object):
+    """ Rolling counters of many commands held as one
+    ``[commands x buckets x events]`` array.
+
+    Each command gets a row, :meth:`counter` returns a
+    :class:`MatrixRollingNumber` view of it that can be used wherever a
+    :class:`hystrix.rolling_number.RollingNumber` is, for instance as the
+    ``counter`` of a :class:`hystrix.command_metrics.CommandMetrics`.
+
+    All the rows share the same buckets so rolling the window is a single
+    column operation, and the health of every command is computed in one
+    vectorized pass by :meth:`health_counts` and :meth:`tripped`.
+
+    Like :class:`hystrix.rolling_number.Bucket`, the current bucket is kept
+    in one plain :class:`array.array` per writing thread holding a vector
+    per row, so writes take no lock and don't touch NumPy. The thread
+    vectors are added up (or maxed) into the array when the window rolls,
+    and on reads. Rolls, row allocations and reads are serialized by a
+    single lock.
+
+    Example::
+
+        >>> matrix = MetricsMatrix(10000, 10)
+        >>> metrics = CommandMetrics('UserCommand', 'UserGroup', None,
+        ...                          properties, event_notifier,
+        ...                          counter=matrix.counter('UserCommand'))
+        >>> matrix.tripped(volume_threshold=20, error_threshold=50)
+        ['UserCommand']
+
+    Args:
+        milliseconds (int): Rolling window length.
+        bucket_numbers (int): Number of buckets in the window.
+        capacity (int): Rows allocated upfront, doubled when exhausted.
+        events: Events class, defaults to
+            :class:`hystrix.rolling_number.RollingNumberEvent`, see
+            :meth:`hystrix.rolling_number.RollingNumberEvent.extend`.
+    """
+
+    def __init__(self, milliseconds, bucket_numbers, capacity=64,
+                 _time=None, events=None):
+        if numpy is None:
+            raise ImportError('MetricsMatrix requires numpy.')
+
+        if milliseconds % bucket_numbers != 0:
+            raise Exception('The milliseconds must divide equally into '
+                            'bucket_numbers. For example 1000/10 is ok, '
+                            '1000/11 is not.')
+
+        self.time = _time or MonotonicTime()
+        self.milliseconds = milliseconds
+        self.bucket_numbers = bucket_numbers
+
+        self.events = events or RollingNumberEvent
+        events = tuple(self.events.__members__.values())
+        self._events = events
+        self._length = len(events)
+        self._counters = numpy.array([event.ordinal for event in events
+                                      if event.is_counter()], dtype=numpy.intp)
+        self._maxes = numpy.array([event.ordinal for event in events
+                                   if event.is_max_updater()],
+                                  dtype=numpy.intp)
+
+        self._bucket_size = milliseconds / bucket_numbers
+        self._values = numpy.zeros((capacity, bucket_numbers, len(events)),
+                                   dtype=numpy.int64)
+        self._cumulative = numpy.zeros((capacity, len(events)),
+                                       dtype=numpy.int64)
+        self._rows = {}
+        self._current = None
+        # Current bucket vectors of every row keyed by writing thread
+        self._stripes = {}
+        self._lock = RLock()
+
+    def buckets_size_in_milliseconds(self):
+        return self._bucket_size
+
+    def keys(self):
+        """ Command keys in row order.
+
+        Returns:
+            list: Keys given to :meth:`counter`.
+        """
+        return sorted(self._rows, key=self._rows.get)
+
+    def counter(self, key):
+        """ Return the view of the row of ``key``, allocating the row on
+        first use.
+
+        Returns:
+            :class:`MatrixRollingNumber`: Row view.
+        """
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None:
+                row = len(self._rows)
+                if row == len(self._values):
+                    self._grow()
+                self._rows[key] = row
+
+        return MatrixRollingNumber(self, row)
+
+    def _grow(self):
+        capacity = len(self._values) * 2
+        values = numpy.zeros((capacity,) + self._values.shape[1:],
+                             dtype=numpy.int64)
+        values[:len(self._values)] = self._values
+        cumulative = numpy.zeros((capacity,) + self._cumulative.shape[1:],
+                                 dtype=numpy.int64)
+        cumulative[:len(self._cumulative)] = self._cumulative
+        self._values = values
+        self._cumulative = cumulative
+
+        # Thread vectors are replaced rather than resized, readers may hold
+        # views of them.
+        padding = array('q', [0]) * (len(values) * self._length)
+        for ident, stripe in list(self._stripes.items()):
+            grown = array('q', stripe)
+            grown.extend(padding[len(stripe):])
+            self._stripes[ident] = grown
+
+    def _stripe(self):
+        # Current bucket vectors of the calling thread, rolling the window
+        # first if needed. Only takes the lock on rolls and on the first
+        # write of a thread.
+        epoch = int(self.time.current_time_in_millis() // self._bucket_size)
+        if epoch != self._current:
+            with self._lock:
+                self._slot()
+
+        try:
+            return self._stripes[get_ident()]
+        except KeyError:
+            with self._lock:
+                stripe = array('q', [0]) * (len(self._values) * self._length)
+                return self._stripes.setdefault(get_ident(), stripe)
+
+    def _current_values(self, rows):
+        # Must be called with the lock held, thread vectors of ``rows``
+        # added up, or maxed for max updaters.
+        stripes = [numpy.frombuffer(stripe, dtype=numpy.int64)
+                   .reshape(-1, self._length)[rows]
+                   for stripe in list(self._stripes.values())]
+        if not stripes:
+            return numpy.zeros_like(self._cumulative[rows])
+        if len(stripes) == 1:
+            return stripes[0].copy()
+
+        stacked = numpy.stack(stripes)
+        values = stacked.sum(axis=0)
+        values[..., self._maxes] = stacked[..., self._maxes].max(axis=0)
+        return values
+
+    def _clear_current(self, rows):
+        for stripe in list(self._stripes.values()):
+            numpy.frombuffer(stripe, dtype=numpy.int64) \
+                .reshape(-1, self._length)[rows] = 0
+
+    def _slot(self):
+        # Must be called with the lock held, moves the window forward if
+        # needed and returns the current bucket index.
+        epoch = int(self.time.current_time_in_millis() // self._bucket_size)
+        current = self._current
+
+        if current is not None and epoch > current:
+            # The thread vectors become the bucket that stops being current.
+            # A writer that looked its vector up just before may still add
+            # to it, landing in the new bucket, which is acceptable for
+            # rolling statistics.
+            rows = numpy.s_[:len(self._rows)]
+            slot = current % self.bucket_numbers
+            self._values[rows, slot] = self._current_values(rows)
+            self._clear_current(rows)
+
+            # The buckets reused for the new epochs fall out of the window.
+            for skipped in range(max(current + 1,
+                                     epoch - self.bucket_numbers + 1),
+                                 epoch + 1):
+                self._retire(numpy.s_[:], skipped % self.bucket_numbers)
+
+        if current is None or epoch > current:
+            self._current = epoch
+
+        return self._current % self.bucket_numbers
+
+    def _retire(self, rows, slot):
+        values = self._values[rows, slot]
+        cumulative = self._cumulative[rows]
+        cumulative[..., self._counters] += values[..., self._counters]
+        cumulative[..., self._maxes] = numpy.maximum(
+            cumulative[..., self._maxes], values[..., self._maxes])
+        values[...] = 0
+
+    def _member(self, event):
+        try:
+            if self._events[event.ordinal] is event:
+                return
+        except IndexError:
+            pass
+        self.events.check(event)
+
+    def _add(self, row, values):
+        stripe = self._stripe()
+        offset = row * self._length
+        for event, value in values:
+            self._member(event)
+            ordinal = offset + event.ordinal
+            if event.is_counter():
+                stripe[ordinal] += value
+            elif event.is_max_updater():
+                if value > stripe[ordinal]:
+                    stripe[ordinal] = value
+            else:
+                raise Exception('Unknown type of event.')
+
+    def _reset(self, row):
+        with self._lock:
+            slot = self._slot()
+            self._values[row, slot] = self._current_values(row)
+            self._clear_current(row)
+            for slot in range(self.bucket_numbers):
+                self._retire(row, slot)
+
+    def _window(self, rows):
+        # Must be called with the lock held, rolling sums and maxes of
+        # ``rows``. The current bucket of the array stays empty until the
+        # window rolls, its values are in the thread vectors.
+        self._slot()
+        values = self._values[rows]
+        current = self._current_values(rows)
+        rolling = values.sum(axis=-2) + current
+        rolling[..., self._maxes] = numpy.maximum(
+            values[..., self._maxes].max(axis=-2), current[..., self._maxes])
+        return rolling
+
+    def rolling(self):
+        """ Rolling sums of the **counter** events and rolling maxes of the
+        **max updater** events of every command.
+
+        Returns:
+            numpy.ndarray: ``[commands x events]`` array, in :meth:`keys`
+                order and indexed by event ordinal.
+        """
+        with self._lock:
+            return self._window(numpy.s_[:len(self._rows)])
+
+    def cumulative(self):
+        """ Cumulative sums (or maxes) of every command, see
+        :meth:`rolling`.
+
+        Returns:
+            numpy.ndarray: ``[commands x events]`` array.
+        """
+        with self._lock:
+            rolling = self.rolling()
+            cumulative = self._cumulative[:len(rolling)].copy()
+        cumulative[:, self._counters] += rolling[:, self._counters]
+        cumulative[:, self._maxes] = numpy.maximum(
+            cumulative[:, self._maxes], rolling[:, self._maxes])
+        return cumulative
+
+    def _health(self):
+        rolling = self.rolling()
+        total = rolling[:, [event.ordinal for event in HEALTH_EVENTS]]
+        total = total.sum(axis=1)
+        error = total - rolling[:, RollingNumberEvent.SUCCESS.ordinal]
+        # Same float arithmetic as CommandMetrics.health_counts so both
+        # agree at the threshold
+        ratio = numpy.zeros(total.shape)
+        numpy.divide(error, total, out=ratio, where=total > 0)
+        error_percentage = (ratio * 100).astype(numpy.int64)
+        return total, error, error_percentage
+
+    def health_counts(self):
+        """ Health counts of every command, computed together.
+
+        Returns:
+            dict: :class:`hystrix.command_metrics.HealthCounts` keyed by
+                command key.
+        """
+        total, error, error_percentage = self._health()
+        return dict((key, HealthCounts(int(total[row]), int(error[row]),
+                                       int(error_percentage[row])))
+                    for key, row in self._rows.items() if row < len(total))
+
+    def tripped(self, volume_threshold, error_threshold):
+        """ Commands whose circuit should open.
+
+        Args:
+            volume_threshold (int): Minimum requests in the rolling window.
+            error_threshold (int): Minimum error percentage.
+
+        Returns:
+            list: Command keys, in :meth:`keys` order.
+        """
+        total, error, error_percentage = self._health()
+        rows = numpy.flatnonzero((total >= volume_threshold) &
+                                 (error_percentage >= error_threshold))
+        keys = self.keys()
+        return [keys[row] for row in rows]
+
+
+class MatrixRollingNumber(object):
+    """ :class:`hystrix.rolling_number.RollingNumber` like view of one row of
+    a :class:`MetricsMatrix`, see :meth:`MetricsMatrix.counter`.
+    """
+
+    def __init__(self, matrix, row):
+        self.matrix = matrix
+        self.row = row
+        self.offset = row * matrix._length
+        self.time = matrix.time
+        self.milliseconds = matrix.milliseconds
+        self.bucket_numbers = matrix.bucket_numbers
+
+    def buckets_size_in_milliseconds(self):
+        return self.matrix.buckets_size_in_milliseconds()
+
+    def increment(self, event):
+        self.matrix._member(event)
+        self.matrix._stripe()[self.offset + event.ordinal] += 1
+
+    def add(self, event, value):
+        self.matrix._member(event)
+        self.matrix._stripe()[self.offset + event.ordinal] += value
+
+    def record_many(self, values):
+        self.matrix._add(self.row, values.items())
+
+    def update_rolling_max(self, event, value):
+        self.matrix._member(event)
+        stripe = self.matrix._stripe()
+        ordinal = self.offset + event.ordinal
+        if value > stripe[ordinal]:
+            stripe[ordinal] = value
+
+    def reset(self):
+        self.matrix._reset(self.row)
+
+    def _buckets(self, event):
+        matrix = self.matrix
+        matrix._member(event)
+        with matrix._lock:
+            slot = matrix._slot()
+            values = matrix._values[self.row, :, event.ordinal]
+            # Newest first, like the buckets of a RollingNumber.
+            order = [(slot - offset) % matrix.bucket_numbers
+                     for offset in range(matrix.bucket_numbers)]
+            values = values[order]
+            values[0] = matrix._current_values(self.row)[event.ordinal]
+            return values
+
+    def rolling_sum(self, event):
+        return int(self._buckets(event).sum())
+
+    def rolling_max(self, event):
+        return int(self._buckets(event).max())
+
+    def values(self, event):
+        return [int(value) for value in self._buckets(event)]
+
+    def value_of_latest_bucket(self, event):
+        return int(self._buckets(event)[0])
+
+    def cumulative_sum(self, event):
+        matrix = self.matrix
+        matrix._member(event)
+        with matrix._lock:
+            cumulative = int(matrix._cumulative[self.row, event.ordinal])
+            buckets = self._buckets(event)
+        if event.is_max_updater():
+            return max(cumulative, int(buckets.max()))
+        return cumulative + int(buckets.sum())
+
+    def snapshot(self, events=None):
+        matrix = self.matrix
+        with matrix._lock:
+            window = matrix._window(self.row)
+            cumulative = matrix._cumulative[self.row]
+
+            length = len(matrix._events)
+            rolling = [0] * length
+            maximum = [0] * length
+            totals = [0] * length
+
+            for event in matrix._events if events is None else events:
+                matrix._member(event)
+                ordinal = event.ordinal
+                if event.is_counter():
+                    rolling[ordinal] = int(window[ordinal])
+                    totals[ordinal] = int(cumulative[ordinal] +
+                                          window[ordinal])
+                elif event.is_max_updater():
+                    maximum[ordinal] = int(window[ordinal])
+                    totals[ordinal] = int(max(cumulative[ordinal],
+                                              window[ordinal]))
+
+        return RollingNumberSnapshot(rolling, maximum, totals)
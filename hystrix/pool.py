@@ -1,16 +1,24 @@
 from __future__ import absolute_import
 from concurrent.futures import ProcessPoolExecutor
+import threading
 import logging
+import sys
+import weakref
+import time
 
 import six
 
+from hystrix import affinity
+from hystrix.executor import WorkStealingExecutor
+
 log = logging.getLogger(__name__)
 
 
 class PoolMetaclass(type):
 
     __instances__ = dict()
-    __blacklist__ = ('Pool', 'PoolMetaclass')
+    __pools__ = weakref.WeakSet()
+    __blacklist__ = ('Pool', 'WorkStealingPool', 'PoolMetaclass')
 
     def __new__(cls, name, bases, attrs):
 
@@ -29,10 +37,120 @@ class PoolMetaclass(type):
 
         return cls.__instances__[pool_key]
 
+    def __call__(cls, *args, **kwargs):
+        pool = super(PoolMetaclass, cls).__call__(*args, **kwargs)
+        PoolMetaclass.__pools__.add(pool)
+        return pool
+
 
 class Pool(six.with_metaclass(PoolMetaclass, ProcessPoolExecutor)):
+    """ Process pool running :class:`hystrix.command.Command` executions.
+
+    Args:
+        pool_key (str): Pool name.
+        max_workers (int): Number of worker processes.
+        cpu_affinity: Pin every worker process to a CPU set, either an
+            iterable of CPU ids or :data:`hystrix.affinity.NUMA` to give each
+            pool the next NUMA node round-robin. Defaults to the
+            :attr:`cpu_affinity` class attribute, ``None`` disables pinning.
+    """
+
+    pool_key = None
+    cpu_affinity = None
+
+    def __init__(self, pool_key=None, max_workers=5, cpu_affinity=None):
+        if cpu_affinity is None:
+            cpu_affinity = self.cpu_affinity
+
+        self.cpus = None
+        if cpu_affinity is not None and sys.version_info < (3, 7):
+            # ProcessPoolExecutor only takes an initializer from Python 3.7
+            log.warning('CPU affinity requires Python 3.7 or later, {} '
+                        'workers are not pinned.'.format(self.pool_key))
+            cpu_affinity = None
+
+        if cpu_affinity is None:
+            super(Pool, self).__init__(max_workers)
+        else:
+            self.cpus = affinity.cpus_for(cpu_affinity)
+            super(Pool, self).__init__(max_workers,
+                                       initializer=affinity.pin,
+                                       initargs=(self.cpus,))
+
+
+class WorkStealingPool(six.with_metaclass(PoolMetaclass,
+                                          WorkStealingExecutor)):
+    """ Thread pool where each worker has its own queue and idle workers
+    steal from busy ones, see :class:`hystrix.executor.WorkStealingExecutor`.
+
+    Use it for I/O bound commands with a mix of short and long executions,
+    set it as ``pool_class`` on a :class:`hystrix.group.Group` or
+    :class:`hystrix.command.Command`.
+
+    Args:
+        pool_key (str): Pool name.
+        max_workers (int): Number of worker threads.
+    """
 
     pool_key = None
 
     def __init__(self, pool_key=None, max_workers=5):
-        super(Pool, self).__init__(max_workers)
+        super(WorkStealingPool, self).__init__(max_workers)
+
+
+def shutdown(timeout=None, pools=None):
+    """ Drain and shut down every pool, or only ``pools``.
+
+    All pools stop accepting new submissions right away and are shut down in
+    parallel. Commands already submitted get up to ``timeout`` seconds to
+    finish, after that work still queued is cancelled so waiting commands
+    fall back. :class:`hystrix.command.Command` runs fallbacks on the calling
+    thread once its pool is shut down.
+
+    Args:
+        timeout (float): Seconds to wait for in-flight commands, ``None``
+            waits for all of them.
+        pools (list): Pools to shut down, defaults to every pool created.
+
+    Returns:
+        bool: ``True`` if every pool finished within ``timeout``.
+    """
+    deadline = None if timeout is None else time.time() + timeout
+    if pools is None:
+        pools = list(PoolMetaclass.__pools__)
+
+    threads = []
+    for pool in pools:
+        thread = threading.Thread(target=pool.shutdown,
+                                  name='{}-shutdown'.format(pool.pool_key))
+        thread.daemon = True
+        thread.start()
+        threads.append((pool, thread))
+
+    drained = True
+    for pool, thread in threads:
+        if deadline is None:
+            thread.join()
+        else:
+            thread.join(max(0, deadline - time.time()))
+
+        if thread.is_alive():
+            log.warning('{} did not drain in time, cancelling queued '
+                        'work.'.format(pool.pool_key))
+            _cancel(pool)
+            drained = False
+
+    return drained
+
+
+def _cancel(pool):
+    # Stop ``pool`` without waiting, cancelling the work still queued.
+    if sys.version_info >= (3, 9) or isinstance(pool, WorkStealingExecutor):
+        pool.shutdown(wait=False, cancel_futures=True)
+        return
+
+    # cancel_futures is only accepted from Python 3.9, queued work of older
+    # ProcessPoolExecutor is cancelled by hand.
+    pool.shutdown(wait=False)
+    for item in list(getattr(pool, '_pending_work_items', {}).values()):
+        item.future.cancel()
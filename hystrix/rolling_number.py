@@ -1,13 +1,18 @@
 from __future__ import absolute_import
-from multiprocessing import RLock
+from threading import RLock, Thread, Event as ThreadEvent
 from collections import deque
+from array import array
 import logging
+import atexit
+import weakref
+import struct
+import mmap
 import types
 import time
+import os
 
 import six
-
-from atomos.multiprocessing.atomic import AtomicLong
+from six.moves._thread import get_ident
 
 log = logging.getLogger(__name__)
 
@@ -28,33 +33,86 @@ class RollingNumber(object):
     (or whatever granularity is defined by the arguments) rather than
     each 10 second window starting at 0 again.
 
-    Performance-wise this class is optimized for writes, not reads. This is
-    done because it expects far higher write volume (thousands/second) than
-    reads (a few per second).
-
-    For example, on each read to getSum/getCount it will iterate buckets to
-    sum the data so that on writes we don't need to maintain the overall sum
-    and pay the synchronization cost at each write to ensure the sum is
-    up-to-date when the read can easily iterate each bucket to get the sum
-    when it needs it.
+    Performance-wise writes only touch the current bucket. The totals of the
+    other buckets in the rolling window are kept up to date once per bucket
+    roll, when a bucket stops being current it is added to them and when it
+    falls out of the window it is subtracted, so reads such as
+    :meth:`rolling_sum` cost the same whatever the number of buckets.
+
+    Longer windows can be tracked by the same :class:`RollingNumber` with
+    ``rollups``, a list of ``(milliseconds, bucket_numbers)`` each defining a
+    :class:`Rollup`. Buckets that stop being current are folded into every
+    rollup, so writes still only touch the current bucket, and reads pass
+    the ``milliseconds`` of the window they want:
+
+        >>> counter = RollingNumber(10000, 10, rollups=[(60000, 6),
+        ...                                             (3600000, 60)])
+        >>> counter.rolling_sum(RollingNumberEvent.SUCCESS, 60000)
+
+    With a ``path`` the :class:`CumulativeSum` is persisted to that file and
+    reloaded from it, see :meth:`flush`. The file belongs to the process
+    that created the :class:`RollingNumber`, processes forked from it keep
+    counting in private memory and don't persist.
+
+    Buckets hold a counter for each member of ``events``, which defaults to
+    :class:`RollingNumberEvent`. Pass a class made by
+    :meth:`RollingNumberEvent.extend` to track custom events as well, or one
+    defined with :class:`EventMetaclass` to track only custom events. Only
+    members of ``events`` can be recorded.
 
     See test module :mod:`tests.test_rolling_number` for usage and expected
     behavior examples.
     """
 
-    def __init__(self, milliseconds, bucket_numbers, _time=None):
-        self.time = _time or ActualTime()  # Create a instance of time here
+    def __init__(self, milliseconds, bucket_numbers, _time=None, rollups=(),
+                 path=None, events=None):
+        self.time = _time or MonotonicTime()  # Create a instance of time here
         self.milliseconds = milliseconds
-        self.buckets = BucketCircular(bucket_numbers)
         self.bucket_numbers = bucket_numbers
-        self.cumulative = CumulativeSum()
-        self._new_bucket_lock = RLock()
 
         if self.milliseconds % self.bucket_numbers != 0:
             raise Exception('The milliseconds must divide equally into '
                             'bucket_numbers. For example 1000/10 is ok, '
                             '1000/11 is not.')
 
+        self.events = events or RollingNumberEvent
+        events = tuple(self.events.__members__.values())
+        self._events = events
+        self._counters = tuple(event.ordinal for event in events
+                               if event.is_counter())
+        self._maxes = tuple(event.ordinal for event in events
+                            if event.is_max_updater())
+        # Events by ordinal, checked against what is recorded
+        self._adders = tuple(event if event.is_counter() else None
+                             for event in events)
+        self._max_updaters = tuple(event if event.is_max_updater() else None
+                                   for event in events)
+        self._zeros = _zeros(len(events))
+
+        self.buckets = BucketRing(bucket_numbers, len(events))
+        self.cumulative = CumulativeSum(path=path, events=self.events)
+        self._bucket_size = self.buckets_size_in_milliseconds()
+        self._new_bucket_lock = RLock()
+
+        self.rollups = {}
+        for rollup_milliseconds, rollup_bucket_numbers in rollups:
+            rollup = Rollup(rollup_milliseconds, rollup_bucket_numbers,
+                            self._counters, self._maxes, len(events))
+            if rollup.bucket_size % self._bucket_size != 0:
+                raise Exception('The rollup buckets must be a multiple of '
+                                'the buckets. For example 60000/6 is ok for '
+                                '10000/10, 60000/7 is not.')
+            self.rollups[rollup_milliseconds] = rollup
+
+        if path is not None:
+            atexit.register(_flush_at_exit, weakref.ref(self))
+
+        # Totals (or maxes, for max updaters) of the rolling window buckets
+        # that are no longer current paired with the current bucket.
+        # Replaced as a whole on every roll so readers always see a
+        # consistent pair.
+        self._state = (self._zeros, None)
+
     def buckets_size_in_milliseconds(self):
         return self.milliseconds / self.bucket_numbers
 
@@ -71,8 +129,50 @@ class RollingNumber(object):
         Args:
             event (:class:`RollingNumberEvent`): Event defining which
                 **counter** to increment.
+
+        Raises:
+            Exception: ``event`` is not a **counter**.
+        """
+        self._adder(event)
+        self.current_bucket().add(event, 1)
+
+    def add(self, event, value):
+        """ Add ``value`` to the **counter** in the current bucket for the
+        given :class:`RollingNumberEvent` type.
+
+        The :class:`RollingNumberEvent` must be a **counter** type
+
+            >>> RollingNumberEvent.isCounter()
+            True
+
+        Args:
+            event (:class:`RollingNumberEvent`): Event defining which
+                **counter** to add to.
+            value (int): Value to add.
+
+        Raises:
+            Exception: ``event`` is not a **counter**.
+        """
+        self._adder(event)
+        self.current_bucket().add(event, value)
+
+    def record_many(self, values):
+        """ Record several events at once.
+
+        The current bucket is looked up once for the whole batch, **counter**
+        events are added their value and **max updater** events retain it if
+        it is above their max.
+
+            >>> counter.record_many({RollingNumberEvent.SUCCESS: 120,
+            ...                      RollingNumberEvent.FAILURE: 3})
+
+        Args:
+            values (dict): Value to record keyed by
+                :class:`RollingNumberEvent`.
         """
-        self.current_bucket().adder(event).increment()
+        for event in values:
+            self._member(event)
+        self.current_bucket().add_many(values)
 
     def update_rolling_max(self, event, value):
         """ Update a value and retain the max value.
@@ -87,100 +187,118 @@ class RollingNumber(object):
             event (:class:`RollingNumberEvent`): Event defining which
                 **counter** to increment.
 
+        Raises:
+            Exception: ``event`` is not a **max updater**.
         """
-        self.current_bucket().max_updater(event).update(value)
+        self._max_updater(event)
+        self.current_bucket().update_max(event, value)
+
+    def _adder(self, event):
+        try:
+            if self._adders[event.ordinal] is event:
+                return
+        except IndexError:
+            pass
+        self.events.check(event)
+        raise Exception('Type is not a LongAdder.')
+
+    def _max_updater(self, event):
+        try:
+            if self._max_updaters[event.ordinal] is event:
+                return
+        except IndexError:
+            pass
+        self.events.check(event)
+        raise Exception('Type is not a LongMaxUpdater.')
+
+    def _member(self, event):
+        try:
+            if self._events[event.ordinal] is event:
+                return
+        except IndexError:
+            pass
+        self.events.check(event)
 
     def current_bucket(self):
         """ Retrieve the current :class:`Bucket`
 
-        Retrieve the latest :class:`Bucket` if the given time is **BEFORE**
-        the end of the **bucket** window, otherwise it returns ``None``.
-
-        The following needs to be synchronized/locked even with a
-        synchronized/thread-safe data structure such as LinkedBlockingDeque
-        because the logic involves multiple steps to check existence,
-        create an object then insert the object. The 'check' or 'insertion'
-        themselves are thread-safe by themselves but not the aggregate
-        algorithm, thus we put this entire block of logic inside
-        synchronized.
-
-        I am using a :class:`multiprocessing.RLock` if/then
-        so that a single thread will get the lock and as soon as one thread
-        gets the lock all others will go the 'else' block and just return
-        the currentBucket until the newBucket is created. This should allow
-        the throughput to be far higher and only slow down 1 thread instead
-        of blocking all of them in each cycle of creating a new bucket based
-        on some testing (and it makes sense that it should as well).
+        Buckets live in a :class:`BucketRing` preallocated with
+        :attr:`bucket_numbers` buckets, the bucket of a given time is at
+        ``(time // bucket_size) % bucket_numbers``. While the time stays in
+        the current bucket window no lock is taken.
+
+        When the time moves past it, a single thread takes the lock, adds the
+        bucket that is no longer current to the :class:`CumulativeSum` and
+        resets in place the buckets between it and the new current one, they
+        represent windows without any traffic. If the whole rolling window
+        passed the :class:`RollingNumber` is :meth:`reset`.
 
         This means the timing won't be exact to the millisecond as to what
-        data ends up in a bucket, but that's acceptable. It's not critical
-        to have exact precision to the millisecond, as long as it's rolling,
-        if we can instead reduce the impact synchronization.
-
-        More importantly though it means that the 'if' block within the
-        lock needs to be careful about what it changes that can still
-        be accessed concurrently in the 'else' block since we're not
-        completely synchronizing access.
-
-        For example, we can't have a multi-step process to add a bucket,
-        remove a bucket, then update the sum since the 'else' block of code
-        can retrieve the sum while this is all happening. The trade-off is
-        that we don't maintain the rolling sum and let readers just iterate
-        bucket to calculate the sum themselves. This is an example of
-        favoring write-performance instead of read-performance and how the
-        tryLock versus a synchronized block needs to be accommodated.
+        data ends up in a bucket, a thread that read the previous bucket just
+        before the roll may still write to it, but that's acceptable. It's
+        not critical to have exact precision to the millisecond, as long as
+        it's rolling, if we can instead reduce the impact synchronization.
 
         Returns:
-            bucket: Returns the latest :class:`Bucket` or ``None``.
+            bucket: Returns the latest :class:`Bucket`.
         """
+        epoch = int(self.time.current_time_in_millis() // self._bucket_size)
 
-        # TODO: Check the doc string above^.
-        current_time = self.time.current_time_in_millis()
-
-        # a shortcut to try and get the most common result of immediately
+        # A shortcut to try and get the most common result of immediately
         # finding the current bucket
-
-        # Retrieve the latest bucket if the given time is BEFORE the end of
-        # the bucket window, otherwise it returns None.
-
-        # NOTE: This is thread-safe because it's accessing 'buckets' which is
-        #       a ?LinkedBlockingDeque?
-        current_bucket = self.buckets.peek_last()
-        if current_bucket is not None and current_time < (current_bucket.window_start + self.buckets_size_in_milliseconds()):
-            return current_bucket
+        if epoch == self.buckets.current:
+            return self.buckets.bucket(epoch)
 
         with self._new_bucket_lock:
-            # If we didn't find the current bucket above, then we have to
-            # create one.
-            if self.buckets.peek_last() is None:
-                new_bucket = Bucket(current_time)
-                self.buckets.add_last(new_bucket)
-                return new_bucket
-            else:
-                for i in range(self.bucket_numbers):
-                    last_bucket = self.buckets.peek_last()
-                    if current_time < (last_bucket.window_start + self.buckets_size_in_milliseconds()):
-                        return last_bucket
-                    elif current_time - (last_bucket.window_start + self.buckets_size_in_milliseconds()) > self.milliseconds:
-                        self.reset()
-                        return self.current_bucket()
-                    else:
-                        self.buckets.add_last(Bucket(last_bucket.window_start + self.buckets_size_in_milliseconds()))
-                        self.cumulative.add_bucket(last_bucket)
-
-                return self.buckets.peek_last()
-
-        # we didn't get the lock so just return the latest bucket while
-        # another thread creates the next one
-        current_bucket = self.buckets.peek_last()
-        if current_bucket is not None:
-            return current_bucket
+            return self._advance(epoch)
+
+    def _advance(self, epoch):
+        buckets = self.buckets
+        current = buckets.current
+
+        # Another thread already moved forward (or the time source went
+        # backwards), keep using the latest bucket.
+        if current is not None and epoch <= current:
+            return buckets.peek_last()
+
+        if current is None or epoch - current >= self.bucket_numbers:
+            self.reset()
+            buckets.first = epoch
+            current = epoch - 1
+            window = array('q', self._zeros)
         else:
-            # The rare scenario where multiple threads raced to create the
-            # very first bucket wait slightly and then use recursion while
-            # the other thread finishes creating a bucket
-            time.sleep(5)
-            self.current_bucket()
+            folded = self._retire(buckets.peek_last())
+            window = array('q', self._state[0])
+            for ordinal in self._counters:
+                window[ordinal] += folded[ordinal]
+
+        # Buckets reused for the new epochs fall out of the rolling window,
+        # the ones skipped over had no traffic.
+        for skipped in range(current + 1, epoch + 1):
+            bucket = buckets.bucket(skipped)
+            for ordinal in self._counters:
+                window[ordinal] -= bucket.folded[ordinal]
+            bucket.reset(skipped * self._bucket_size)
+
+        bucket = buckets.bucket(epoch)
+        buckets.current = epoch
+
+        # Max updaters can't be subtracted, their window max is cached once
+        # per roll instead.
+        for ordinal in self._maxes:
+            window[ordinal] = max(b.folded[ordinal] for b in buckets)
+
+        self._state = (window, bucket)
+        return bucket
+
+    def _retire(self, bucket):
+        # Fold the bucket that stops being current into the cumulative sum
+        # and the rollups.
+        folded = bucket.fold(self._maxes)
+        self.cumulative.add(folded)
+        for rollup in self.rollups.values():
+            rollup.add(bucket.window_start, folded)
+        return folded
 
     def reset(self):
         """ Reset all rolling **counters**
@@ -188,15 +306,34 @@ class RollingNumber(object):
         Force a reset of all rolling **counters** (clear all **buckets**) so
         that statistics start being gathered from scratch.
 
-        This does NOT reset the :class:`CumulativeSum` values.
+        This does NOT reset the :class:`CumulativeSum` nor the
+        :class:`Rollup` values.
         """
-        last_bucket = self.buckets.peek_last()
-        if last_bucket:
-            self.cumulative.add_bucket(last_bucket)
+        with self._new_bucket_lock:
+            last_bucket = self.buckets.peek_last()
+            if last_bucket is not None:
+                self._retire(last_bucket)
 
-        self.buckets.clear()
+            self.buckets.clear()
+            self._state = (self._zeros, None)
 
-    def rolling_sum(self, event):
+    def flush(self):
+        """ Persist the current bucket along with the :class:`CumulativeSum`
+
+        Buckets that rolled out are persisted as they roll, the current one
+        only when flushing, which is done at exit. Does nothing unless the
+        :class:`RollingNumber` was created with a ``path``.
+        """
+        if self.cumulative.path is None:
+            return
+
+        with self._new_bucket_lock:
+            bucket = self.buckets.peek_last()
+            if bucket is not None:
+                self.cumulative.stage(bucket.totals(self._maxes))
+            self.cumulative.flush()
+
+    def rolling_sum(self, event, milliseconds=None):
         """ Rolling sum
 
         Get the sum of all buckets in the rolling counter for the given
@@ -210,41 +347,86 @@ class RollingNumber(object):
         Args:
             event (:class:`RollingNumberEvent`): Event defining which counter
                 to retrieve values from.
+            milliseconds (int): Window of one of the ``rollups``, defaults to
+                :attr:`milliseconds`.
 
         Returns:
             long: Return value from the given :class:`RollingNumberEvent`
                 counter type.
         """
-        last_bucket = self.current_bucket()
-        if not last_bucket:
-            return 0
+        self._adder(event)
 
-        sum = 0
-        for bucket in self.buckets:
-            sum += bucket.adder(event).sum()
-        return sum
+        if milliseconds not in (None, self.milliseconds):
+            rollup, bucket = self._rollup(milliseconds)
+            return rollup.sum(event, rollup.epoch(self.time)) + \
+                bucket.get(event)
 
-    def rolling_max(self, event):
-        values = self.values(event)
-        if not values:
-            return 0
-        else:
-            return values[len(values) - 1]
+        self.current_bucket()
+
+        window, bucket = self._state
+        if bucket is None:
+            return window[event.ordinal]
+        return window[event.ordinal] + bucket.get(event)
+
+    def rolling_max(self, event, milliseconds=None):
+        """ Rolling max
+
+        Get the max value of all buckets in the rolling counter for the
+        given :class:`RollingNumberEvent`.
+
+        The :class:`RollingNumberEvent` must be a **max updater** type
+
+            >>> RollingNumberEvent.isMaxUpdater()
+            True
+
+        Args:
+            event (:class:`RollingNumberEvent`): Event defining which max
+                updater to retrieve values from.
+            milliseconds (int): Window of one of the ``rollups``, defaults to
+                :attr:`milliseconds`.
+
+        Returns:
+            long: Max value of the given :class:`RollingNumberEvent` max
+                updater type.
+        """
+        self._member(event)
+
+        if milliseconds not in (None, self.milliseconds):
+            rollup, bucket = self._rollup(milliseconds)
+            return max(rollup.max(event, rollup.epoch(self.time)),
+                       bucket.get(event))
+
+        self.current_bucket()
+
+        window, bucket = self._state
+        if bucket is None:
+            return window[event.ordinal]
+        return max(window[event.ordinal], bucket.get(event))
+
+    def _rollup(self, milliseconds):
+        try:
+            rollup = self.rollups[milliseconds]
+        except KeyError:
+            raise Exception('No rollup of {} milliseconds.'.format(
+                milliseconds))
+
+        # Moving forward first folds the buckets that are no longer current
+        # into the rollup, the current one is read on its own.
+        return rollup, self.current_bucket()
 
     def values(self, event):
+        self._member(event)
         last_bucket = self.current_bucket()
         if not last_bucket:
             return 0
 
         values = []
         for bucket in self.buckets:
-            if event.is_counter():
-                values.append(bucket.adder(event).sum())
-            if event.is_max_updater():
-                values.append(bucket.max_updater(event).max())
+            values.append(bucket.get(event))
         return values
 
     def value_of_latest_bucket(self, event):
+        self._member(event)
         last_bucket = self.current_bucket()
         if not last_bucket:
             return 0
@@ -274,8 +456,77 @@ class RollingNumber(object):
                 type.
 
         """
+        if event.is_max_updater():
+            return max(self.value_of_latest_bucket(event),
+                       self.cumulative.get(event))
+
         return self.value_of_latest_bucket(event) + self.cumulative.get(event)
 
+    def snapshot(self, events=None):
+        """ Snapshot
+
+        Rolling sums, rolling maxes and cumulative sums of several
+        :class:`RollingNumberEvent` read together, moving the buckets forward
+        and merging the current bucket only once.
+
+        Args:
+            events (iterable): :class:`RollingNumberEvent` to read, defaults
+                to all of them. The others read as ``0`` in the snapshot.
+
+        Returns:
+            :class:`RollingNumberSnapshot`: Immutable snapshot.
+        """
+        self.current_bucket()
+
+        window, bucket = self._state
+        if bucket is None:
+            current = self._zeros
+        else:
+            current = bucket.totals(self._maxes)
+
+        rolling = list(self._zeros)
+        maximum = list(self._zeros)
+        cumulative = list(self._zeros)
+
+        for event in self._events if events is None else events:
+            self._member(event)
+            ordinal = event.ordinal
+            if event.is_counter():
+                rolling[ordinal] = window[ordinal] + current[ordinal]
+                cumulative[ordinal] = self.cumulative.get(event) + \
+                    current[ordinal]
+            elif event.is_max_updater():
+                maximum[ordinal] = max(window[ordinal], current[ordinal])
+                cumulative[ordinal] = max(self.cumulative.get(event),
+                                          current[ordinal])
+
+        return RollingNumberSnapshot(rolling, maximum, cumulative)
+
+
+class RollingNumberSnapshot(object):
+    """ Values of a :class:`RollingNumber` at one point in time, see
+    :meth:`RollingNumber.snapshot`.
+    """
+
+    __slots__ = ('_rolling', '_maximum', '_cumulative')
+
+    def __init__(self, rolling, maximum, cumulative):
+        self._rolling = tuple(rolling)
+        self._maximum = tuple(maximum)
+        self._cumulative = tuple(cumulative)
+
+    def rolling_sum(self, event):
+        """ Same as :meth:`RollingNumber.rolling_sum` """
+        return self._rolling[event.ordinal]
+
+    def rolling_max(self, event):
+        """ Same as :meth:`RollingNumber.rolling_max` """
+        return self._maximum[event.ordinal]
+
+    def cumulative_sum(self, event):
+        """ Same as :meth:`RollingNumber.cumulative_sum` """
+        return self._cumulative[event.ordinal]
+
 
 class BucketCircular(deque):
     ''' This is a circular array acting as a FIFO queue. '''
@@ -300,131 +551,519 @@ class BucketCircular(deque):
         self.appendleft(bucket)
 
 
+class BucketRing(object):
+    """ Fixed ring of preallocated :class:`Bucket` reused in place.
+
+    Buckets are addressed by *epoch*, the time divided by the bucket size,
+    and iterate from the newest to the oldest bucket of the rolling window.
+    Only :class:`RollingNumber` moves :attr:`current` forward, holding its
+    bucket lock.
+    """
+
+    def __init__(self, size, length=None):
+        self._buckets = tuple(Bucket(None, length) for _ in range(size))
+        # Epoch of the first bucket since the last clear and of the current
+        # bucket, ``None`` while empty.
+        self.first = None
+        self.current = None
+
+    @property
+    def size(self):
+        if self.current is None:
+            return 0
+        return min(len(self._buckets), self.current - self.first + 1)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        current = self.current
+        if current is None:
+            return
+        for epoch in range(current, current - self.size, -1):
+            yield self.bucket(epoch)
+
+    def bucket(self, epoch):
+        return self._buckets[epoch % len(self._buckets)]
+
+    def last(self):
+        return self.peek_last()
+
+    def peek_last(self):
+        current = self.current
+        if current is None:
+            return None
+        return self.bucket(current)
+
+    def clear(self):
+        self.current = None
+        self.first = None
+        for bucket in self._buckets:
+            bucket.reset(None)
+
+
+_zero_vectors = {}
+
+
+class Rollup(object):
+    """ Coarser rolling window of a :class:`RollingNumber`.
+
+    It isn't written to directly, the :class:`RollingNumber` adds the folded
+    values of each of its buckets once it stops being current (under its
+    lock), so a rollup lags behind by the current bucket of the
+    :class:`RollingNumber`, which has to be added on reads.
+
+    Each slot remembers the epoch it holds so reads skip the slots that fell
+    out of the window without having to move the rollup forward.
+
+    Args:
+        milliseconds (int): Window length.
+        bucket_numbers (int): Number of buckets in the window.
+        counters (tuple): Ordinals of the **counter** events.
+        maxes (tuple): Ordinals of the **max updater** events.
+        length (int): Number of events.
+    """
+
+    def __init__(self, milliseconds, bucket_numbers, counters, maxes,
+                 length):
+        if milliseconds % bucket_numbers != 0:
+            raise Exception('The milliseconds must divide equally into '
+                            'bucket_numbers. For example 1000/10 is ok, '
+                            '1000/11 is not.')
+
+        self.milliseconds = milliseconds
+        self.bucket_numbers = bucket_numbers
+        self.bucket_size = milliseconds / bucket_numbers
+        self._counters = counters
+        self._maxes = maxes
+        self._slots = [array('q', _zeros(length))
+                       for _ in range(bucket_numbers)]
+        self._epochs = [None] * bucket_numbers
+
+    def epoch(self, time):
+        return int(time.current_time_in_millis() // self.bucket_size)
+
+    def add(self, start_time, folded):
+        """ Add the folded values of a bucket starting at ``start_time``.
+        """
+        epoch = int(start_time // self.bucket_size)
+        index = epoch % self.bucket_numbers
+        slot = self._slots[index]
+
+        if self._epochs[index] != epoch:
+            # Older slots fall out of the window, newer ones mean a bucket
+            # arrived late and is dropped.
+            if self._epochs[index] is not None and \
+                    self._epochs[index] > epoch:
+                return
+            for ordinal in range(len(slot)):
+                slot[ordinal] = 0
+            self._epochs[index] = epoch
+
+        for ordinal in self._counters:
+            slot[ordinal] += folded[ordinal]
+        for ordinal in self._maxes:
+            if folded[ordinal] > slot[ordinal]:
+                slot[ordinal] = folded[ordinal]
+
+    def _window(self, epoch):
+        oldest = epoch - self.bucket_numbers
+        return [slot for slot, slot_epoch in zip(self._slots, self._epochs)
+                if slot_epoch is not None and oldest < slot_epoch <= epoch]
+
+    def sum(self, event, epoch):
+        """ Sum of ``event`` over the window ending at ``epoch``. """
+        ordinal = event.ordinal
+        return sum(slot[ordinal] for slot in self._window(epoch))
+
+    def max(self, event, epoch):
+        """ Max of ``event`` over the window ending at ``epoch``. """
+        ordinal = event.ordinal
+        return max([slot[ordinal] for slot in self._window(epoch)] or [0])
+
+
+def _zeros(length):
+    """ Shared all zero vector of ``length`` counters. """
+    try:
+        return _zero_vectors[length]
+    except KeyError:
+        return _zero_vectors.setdefault(length, array('q', [0]) * length)
+
+
 class Bucket(object):
     """ Counters for a given `bucket` of time
 
-    We support both :class:`LongAdder` and :class:`LongMaxUpdater` in a
-    :class:`Bucket` but don't want the memory allocation of all types for each
-    so we only allocate the objects if the :class:`RollingNumberEvent` matches
-    the correct **type** - though we still have the allocation of empty arrays
-    to the given length as we want to keep using the **type** value for fast
-    random access.
+    We support both **counter** and **max updater** events in a
+    :class:`Bucket` and keep them in one contiguous :class:`array.array`
+    vector indexed by :attr:`Event.ordinal` for fast random access instead
+    of allocating one object per :class:`RollingNumberEvent`.
+
+    Like :class:`LongAdder` every writing thread gets its own vector so
+    updates need no lock, reads add up (or take the max of) the vectors.
+
+    Once the bucket is no longer current :meth:`fold` stores the totals in
+    :attr:`folded`, it is what the :class:`RollingNumber` window totals
+    were updated with.
     """
 
-    def __init__(self, start_time):
+    __slots__ = ('window_start', 'folded', '_zeros', '_stripes')
+
+    def __init__(self, start_time, length=None):
+        self.window_start = start_time
+        self._zeros = _zeros(length or len(RollingNumberEvent.__members__))
+        self._stripes = {}
+        self.folded = array('q', self._zeros)
+
+    def _stripe(self):
+        ident = get_ident()
+        try:
+            return self._stripes[ident]
+        except KeyError:
+            stripe = self._stripes[ident] = array('q', self._zeros)
+            return stripe
+
+    def reset(self, start_time):
+        """ Zero every counter in place so the bucket can be reused for the
+        window starting at ``start_time``.
+        """
         self.window_start = start_time
-        self._adder = {}
-        self._max_updater = {}
+        self.folded[:] = self._zeros
+        for stripe in tuple(self._stripes.values()):
+            stripe[:] = self._zeros
+
+    def fold(self, maxes=()):
+        """ Merge the vector of every thread into :attr:`folded`.
+
+        Args:
+            maxes (tuple): Ordinals of the **max updater** events, the
+                others are added up.
+
+        Returns:
+            array: :attr:`folded`
+        """
+        return self.totals(maxes, self.folded)
+
+    def totals(self, maxes=(), into=None):
+        """ Merge the vector of every thread.
+
+        Args:
+            maxes (tuple): Ordinals of the **max updater** events, the
+                others are added up.
+            into (array): Vector to write to, a new one by default.
+
+        Returns:
+            array: Totals indexed by :attr:`Event.ordinal`.
+        """
+        if into is None:
+            into = array('q', self._zeros)
+        stripes = tuple(self._stripes.values())
+
+        if len(stripes) == 1:
+            into[:] = stripes[0]
+            return into
+
+        into[:] = self._zeros
+        if not stripes:
+            return into
+
+        for stripe in stripes:
+            for ordinal, value in enumerate(stripe):
+                into[ordinal] += value
+
+        for ordinal in maxes:
+            into[ordinal] = max(stripe[ordinal] for stripe in stripes)
 
-        # TODO: Change this to use a metaclass
-        for name, event in RollingNumberEvent.__members__.items():
+        return into
+
+    def add(self, event, value=1):
+        """ Add ``value`` to the **counter** of ``event``. """
+        try:
+            self._stripes[get_ident()][event.ordinal] += value
+        except KeyError:
+            self._stripe()[event.ordinal] += value
+
+    def add_many(self, values):
+        """ Add the values of **counter** events and retain the values of
+        **max updater** events, see :meth:`RollingNumber.record_many`.
+        """
+        stripe = self._stripe()
+        for event, value in values.items():
+            ordinal = event.ordinal
             if event.is_counter():
-                self._adder[event.name] = LongAdder()
+                stripe[ordinal] += value
+            elif event.is_max_updater():
+                if value > stripe[ordinal]:
+                    stripe[ordinal] = value
+            else:
+                raise Exception('Unknown type of event.')
 
-        for name, event in RollingNumberEvent.__members__.items():
-            if event.is_max_updater():
-                self._max_updater[event.name] = LongMaxUpdater()
+    def update_max(self, event, value):
+        """ Retain ``value`` if it is above the **max** of ``event``. """
+        stripe = self._stripe()
+        if value > stripe[event.ordinal]:
+            stripe[event.ordinal] = value
 
     def get(self, event):
+        # Copied in a single step so concurrent writers adding their first
+        # vector don't break the iteration.
+        stripes = tuple(self._stripes.values())
+        ordinal = event.ordinal
+
         if event.is_counter():
-            return self.adder(event).sum()
+            return sum([stripe[ordinal] for stripe in stripes])
 
         if event.is_max_updater():
-            return self.max_updater(event).max()
+            return max([stripe[ordinal] for stripe in stripes] or [0])
 
         raise Exception('Unknown type of event.')
 
-    # TODO: Rename to add
     def adder(self, event):
         if event.is_counter():
-            return self._adder[event.name]
+            return BucketCell(self, event)
 
         raise Exception('Type is not a LongAdder.')
 
-    # TODO: Rename to update_max
     def max_updater(self, event):
         if event.is_max_updater():
-            return self._max_updater[event.name]
+            return BucketCell(self, event)
 
         raise Exception('Type is not a LongMaxUpdater.')
 
 
+class BucketCell(object):
+    """ :class:`LongAdder` and :class:`LongMaxUpdater` like view of one
+    event in a :class:`Bucket`.
+    """
+
+    __slots__ = ('_bucket', '_event')
+
+    def __init__(self, bucket, event):
+        self._bucket = bucket
+        self._event = event
+
+    def increment(self):
+        self._bucket.add(self._event, 1)
+
+    def decrement(self):
+        self._bucket.add(self._event, -1)
+
+    def add(self, value):
+        self._bucket.add(self._event, value)
+
+    def sum(self):
+        return self._bucket.get(self._event)
+
+    def update(self, value):
+        self._bucket.update_max(self._event, value)
+
+    def max(self):
+        return self._bucket.get(self._event)
+
+
 # TODO: Move this to hystrix/util/long_adder.py
 class LongAdder(object):
+    """ Sum kept in one cell per writing thread.
+
+    Each thread only ever writes its own cell so updates need no lock, the
+    cells are added up on :meth:`sum`. Cells are keyed by thread identifier,
+    a thread reusing the identifier of a finished one keeps adding to the
+    same cell which is harmless for a sum.
+    """
 
     def __init__(self, min_value=0):
-        self._count = AtomicLong(value=min_value)
+        self._base = min_value
+        self._cells = {}
 
     def increment(self):
-        self._count.add_and_get(1)
+        self.add(1)
 
     def decrement(self):
-        self._count.subtract_and_get(1)
+        self.add(-1)
 
     def sum(self):
-        return self._count.get()
+        # values() is copied in a single step so concurrent writers adding
+        # their first cell don't break the iteration.
+        return self._base + sum(tuple(self._cells.values()))
 
     def add(self, value):
-        self._count.add_and_get(value)
+        ident = get_ident()
+        cells = self._cells
+        try:
+            cells[ident] += value
+        except KeyError:
+            cells[ident] = value
 
 
 # TODO: Move this to hystrix/util/long_max_updater.py
 class LongMaxUpdater(object):
+    """ Maximum kept in one cell per writing thread, see :class:`LongAdder`.
+    """
 
     def __init__(self, min_value=0):
-        self._count = AtomicLong(value=min_value)
+        self._base = min_value
+        self._cells = {}
 
     def max(self):
-        return self._count.get()
+        return max(tuple(self._cells.values()) + (self._base,))
 
     def update(self, value):
-        if value > self.max():
-            self._count.set(value)
+        ident = get_ident()
+        cells = self._cells
+        if value > cells.get(ident, self._base):
+            cells[ident] = value
 
 
 class CumulativeSum(object):
+    """ Totals of every :class:`Bucket` that rolled out of the
+    :class:`RollingNumber`, indexed by :attr:`Event.ordinal`.
 
-    def __init__(self):
-        self._adder = {}
-        self._max_updater = {}
+    Only updated while holding the :class:`RollingNumber` bucket lock.
 
-        # TODO: Change this to use a metaclass
-        for name, event in RollingNumberEvent.__members__.items():
-            if event.is_counter():
-                self._adder[event.name] = LongAdder()
+    With a ``path`` the totals live in a memory-mapped file updated in place,
+    so they survive restarts without any serialization or fsync when buckets
+    roll, the operating system writes the pages back. The file also holds
+    the totals of the latest bucket as of the last :meth:`stage`, those
+    haven't rolled out yet and are added to the totals on the next start.
 
-        for name, event in RollingNumberEvent.__members__.items():
-            if event.is_max_updater():
-                self._max_updater[event.name] = LongMaxUpdater()
+    The mapping is shared with forked children, which would update the same
+    cells without synchronization. A child detaches on its first update
+    instead, carrying on from a private copy of the totals.
 
-    def add_bucket(self, bucket):
-        for name, event in RollingNumberEvent.__members__.items():
-            if event.is_counter():
-                self.adder(event).add(bucket.adder(event).sum())
+    Args:
+        length (int): Number of events.
+        path (str): File to persist the totals to, created if missing.
+        events: Events class, defaults to :class:`RollingNumberEvent`.
+    """
 
-            if event.is_max_updater():
-                self.max_updater(event).update(bucket.max_updater(event).max())
+    _magic = b'HXCS'
+    _header = struct.Struct('<4sII')
+    _offset = 16
+
+    def __init__(self, length=None, path=None, events=None):
+        events = (events or RollingNumberEvent).__members__.values()
+        length = length or len(events)
+        self._counters = tuple(event.ordinal for event in events
+                               if event.is_counter())
+        self._maxes = tuple(event.ordinal for event in events
+                            if event.is_max_updater())
+        self.path = path
+        self._pid = os.getpid()
+        self._mmap = None
+        self._pending = None
+        self._values = array('q', [0]) * length
+
+        if path is not None:
+            self._open(path, length)
+
+    def _load(self, path):
+        # Totals and latest bucket totals stored in ``path``, if readable.
+        try:
+            with open(path, 'rb') as stored:
+                data = stored.read()
+        except (IOError, OSError):
+            return None
 
-    def get(self, event):
-        if event.is_counter():
-            return self.adder(event).sum()
+        if len(data) < self._offset:
+            return None
+        magic, version, length = self._header.unpack_from(data)
+        size = self._offset + 2 * 8 * length
+        if magic != self._magic or version != 1 or len(data) < size:
+            log.warning('Ignoring unreadable cumulative sums in %s', path)
+            return None
 
-        if event.is_max_updater():
-            return self.max_updater(event).max()
+        values = array('q')
+        values.frombytes(data[self._offset:size])
+        return values[:length], values[length:]
+
+    def _open(self, path, length):
+        stored = self._load(path)
+        if stored is not None:
+            # Events may have been added since the file was written
+            values, pending = stored
+            latest = array('q', [0]) * length
+            for ordinal in range(min(length, len(values))):
+                self._values[ordinal] = values[ordinal]
+                latest[ordinal] = pending[ordinal]
+            self.add(latest)
+
+        # Rewritten whole so a crash while starting can't leave a torn file
+        temporary = '{}.tmp'.format(path)
+        with open(temporary, 'wb') as persisted:
+            persisted.write(self._header.pack(self._magic, 1, length))
+            persisted.write(b'\0' * (self._offset - self._header.size))
+            persisted.write(self._values.tobytes())
+            persisted.write(array('q', [0]).tobytes() * length)
+        os.replace(temporary, path)
+
+        with open(path, 'r+b') as persisted:
+            self._mmap = mmap.mmap(persisted.fileno(), 0)
+
+        view = memoryview(self._mmap)
+        middle = self._offset + 8 * length
+        self._values = view[self._offset:middle].cast('q')
+        self._pending = view[middle:].cast('q')
+
+    def _detach(self):
+        # Called in a process forked after the file was mapped.
+        log.warning('Process %s no longer persists the cumulative sums '
+                    'to %s, they belong to process %s.', os.getpid(),
+                    self.path, self._pid)
+        self._values = array('q', self._values)
+        self._pending = None
+        self._mmap = None
+        self.path = None
+
+    def add(self, totals):
+        """ Add the :meth:`Bucket.fold` totals of a bucket. """
+        if self._mmap is not None and self._pid != os.getpid():
+            self._detach()
+
+        values = self._values
+        for ordinal in self._counters:
+            values[ordinal] += totals[ordinal]
+
+        for ordinal in self._maxes:
+            values[ordinal] = max(values[ordinal], totals[ordinal])
+
+        # The latest bucket is now part of the totals
+        pending = self._pending
+        if pending is not None:
+            for ordinal in range(len(pending)):
+                pending[ordinal] = 0
+
+    def stage(self, totals):
+        """ Persist the totals of the latest bucket, still to be added. """
+        if self._mmap is not None and self._pid != os.getpid():
+            self._detach()
+
+        pending = self._pending
+        if pending is None:
+            return
+
+        for ordinal in range(len(pending)):
+            pending[ordinal] = totals[ordinal]
+
+    def flush(self):
+        """ Write the persisted totals back to disk now. """
+        if self._mmap is not None and self._pid == os.getpid():
+            self._mmap.flush()
 
-        raise Exception('Unknown type of event.')
+    def add_bucket(self, bucket):
+        self.add(bucket.fold(self._maxes))
 
-    def adder(self, event):
-        if event.is_counter():
-            return self._adder[event.name]
+    def get(self, event):
+        if event.is_counter() or event.is_max_updater():
+            return self._values[event.ordinal]
 
         raise Exception('Unknown type of event.')
 
-    def max_updater(self, event):
-        if event.is_max_updater():
-            return self._max_updater[event.name]
 
-        raise Exception('Unknown type of event.')
+def _flush_at_exit(reference):
+    # Registered with atexit through a weak reference so persisted
+    # RollingNumber instances can still be collected.
+    number = reference()
+    if number is not None:
+        number.flush()
 
 
 def _is_function(obj):
@@ -439,10 +1078,17 @@ def _is_dunder(name):
 
 
 class Event(object):
+    """ Member of an events class such as :class:`RollingNumberEvent`.
+
+    :attr:`ordinal` is the index of its counter in the vectors of
+    :class:`Bucket` and :class:`CumulativeSum`, fixed when the class is
+    defined.
+    """
 
-    def __init__(self, name, value):
+    def __init__(self, name, value, ordinal=None):
         self._name = name
         self._value = value
+        self.ordinal = ordinal
 
     def is_counter(self):
         return self._value == 1
@@ -460,16 +1106,30 @@ class Event(object):
 
 
 class EventMetaclass(type):
+    """ Metaclass of events classes such as :class:`RollingNumberEvent`,
+    turning their attributes into :class:`Event` members.
+    """
 
     def __new__(cls, name, bases, attrs):
         __members = {}
 
-        for name, value in attrs.items():
-            if not _is_dunder(name) and not _is_function(value):
-                __members[name] = Event(name, value)
+        # Members of the base classes keep their ordinals so the same event
+        # can be recorded on counters of any subclass.
+        for base in bases:
+            __members.update(getattr(base, '__members__', {}))
 
-        for name, value in __members.items():
-            attrs[name] = __members[name]
+        # Ordinals follow the definition order, they index the counter
+        # vectors of :class:`Bucket` and :class:`CumulativeSum`.
+        for member, value in attrs.items():
+            if _is_dunder(member) or _is_function(value) or \
+                    isinstance(value, classmethod):
+                continue
+            if member in __members:
+                raise Exception('Event {} is already defined.'.format(member))
+            __members[member] = Event(member, value, len(__members))
+
+        for member, event in __members.items():
+            attrs[member] = event
 
         new_class = super(EventMetaclass, cls).__new__(cls, name,
                                                        bases, attrs)
@@ -478,6 +1138,21 @@ class EventMetaclass(type):
 
         return new_class
 
+    def check(cls, event):
+        """ Make sure ``event`` is a member of the events class.
+
+        Members of different events classes may share ordinals, recording
+        an event on a counter of another class would update one of its
+        events instead.
+
+        Raises:
+            Exception: ``event`` is not a member.
+        """
+        name = getattr(event, 'name', event)
+        if cls.__members__.get(name) is not event:
+            raise Exception('Event {} is not a member of {}.'.format(
+                name, cls.__name__))
+
 
 # TODO: Move this to hystrix/util/rolling_number_event.py
 class RollingNumberEvent(six.with_metaclass(EventMetaclass, object)):
@@ -520,6 +1195,33 @@ class RollingNumberEvent(six.with_metaclass(EventMetaclass, object)):
     def __init__(self, event):
         self._event = event
 
+    @classmethod
+    def extend(klass, name, counters=(), max_updaters=()):
+        """ Events class with custom events added to these ones.
+
+        The custom events get the ordinals following the existing ones, a
+        :class:`RollingNumber` created with the returned class allocates
+        counters for these events and the custom ones only.
+
+            >>> PaymentEvent = RollingNumberEvent.extend(
+            ...     'PaymentEvent', counters=['CACHE_HIT_L1', 'CACHE_HIT_L2'],
+            ...     max_updaters=['PAYLOAD_SIZE_MAX'])
+            >>> counter = RollingNumber(10000, 10, events=PaymentEvent)
+            >>> counter.increment(PaymentEvent.CACHE_HIT_L1)
+
+        Args:
+            name (str): Class name.
+            counters (list): Names of the **counter** events.
+            max_updaters (list): Names of the **max updater** events.
+
+        Returns:
+            type: Subclass of this events class.
+        """
+        attrs = dict((member, 1) for member in counters)
+        for member in max_updaters:
+            attrs[member] = 2
+        return type(klass)(name, (klass,), attrs)
+
     def is_counter(self):
         """ Is counter
 
@@ -550,3 +1252,82 @@ class ActualTime(object):
             int: Returns :func:`time.time()` converted to milliseconds
         """
         return int(round(time.time() * 1000))
+
+
+_monotonic = getattr(time, 'monotonic', time.time)
+
+
+class MonotonicTime(object):
+    """ Monotonic time
+
+    Unlike :class:`ActualTime` it never jumps when the wall clock is
+    adjusted (NTP, daylight saving, manual changes), which would make
+    :class:`RollingNumber` reset or misplace buckets. Only meaningful to
+    measure elapsed time.
+    """
+
+    def current_time_in_millis(self):
+        """ Current time in milliseconds
+
+        Returns:
+            int: Returns :func:`time.monotonic()` converted to milliseconds
+        """
+        return int(_monotonic() * 1000)
+
+
+class CoarseTime(object):
+    """ Coarse monotonic time
+
+    A background thread refreshes :attr:`millis` every ``resolution``
+    seconds so reading the time is a plain attribute load. Reads are at most
+    ``resolution`` behind :class:`MonotonicTime`, which is fine for bucket
+    windows of hundreds of milliseconds but not for measuring latencies.
+
+    Share the single instance returned by :meth:`get_instance`, each
+    instance runs its own thread.
+
+    Args:
+        resolution (float): Seconds between refreshes.
+    """
+
+    INSTANCE = None
+
+    def __init__(self, resolution=0.001):
+        self.resolution = resolution
+        self.millis = int(_monotonic() * 1000)
+        self._stopped = ThreadEvent()
+        self._start()
+
+        # Threads don't survive fork, restart the ticker in the child
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._start)
+
+    @classmethod
+    def get_instance(klass):
+        if not klass.INSTANCE:
+            klass.INSTANCE = klass()
+        return klass.INSTANCE
+
+    def _start(self):
+        if self._stopped.is_set():
+            return
+
+        thread = Thread(target=self._tick, name='hystrix-coarse-time')
+        thread.daemon = True
+        thread.start()
+
+    def _tick(self):
+        while not self._stopped.wait(self.resolution):
+            self.millis = int(_monotonic() * 1000)
+
+    def stop(self):
+        """ Stop refreshing the time. """
+        self._stopped.set()
+
+    def current_time_in_millis(self):
+        """ Current time in milliseconds
+
+        Returns:
+            int: Returns :attr:`millis`
+        """
+        return self.millis
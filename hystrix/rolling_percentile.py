@@ -1,27 +1,90 @@
 from __future__ import absolute_import
-from multiprocessing import RLock, Array
+from threading import RLock
+from array import array
+import multiprocessing
 import itertools
 import logging
+import random
 import time
 import math
 
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
 from hystrix.rolling_number import BucketCircular
+from hystrix.sketch import DDSketch
 
 
 log = logging.getLogger(__name__)
 
+# Ticks per second of the units latencies can be recorded in, see
+# :meth:`RollingPercentile.add_duration`
+UNITS = {
+    'milliseconds': 10 ** 3,
+    'microseconds': 10 ** 6,
+    'nanoseconds': 10 ** 9,
+}
+
 
 class RollingPercentile(object):
+    """ Percentiles of the values added over a rolling window.
+
+    Values are recorded by the ``bucket_data`` class of each bucket, which
+    also names the snapshot class computing the percentiles of the buckets
+    that rolled. Snapshots are built lazily by the first read after a roll
+    and cached until the next one, so writers crossing a bucket boundary
+    don't pay for them.
+
+    * :class:`PercentileBucketData` (default) keeps the last
+      ``bucket_data_length`` raw values of each bucket.
+    * :class:`ReservoirBucketData` keeps a uniform sample of
+      ``bucket_data_length`` values of the whole bucket interval.
+    * :class:`SketchBucketData` counts the values in a mergeable
+      :class:`hystrix.sketch.DDSketch`.
+    * :class:`SharedPercentileBucketData` does the same as the default in
+      shared memory, for buckets created before forking and then written
+      by several processes. Buckets created after forking stay private.
+    * :class:`HistogramBucketData` counts the values in log-linear buckets,
+      with bounded memory and relative error whatever the request rate.
+
+    Values are stored as 64-bit integers in ``unit``, which only matters to
+    :meth:`add_duration`. Commands running under a millisecond should use
+    ``microseconds`` or ``nanoseconds``, as given by
+    :meth:`hystrix.command_properties.CommandProperties.metrics_rolling_percentile_unit`,
+    or they all record ``0``.
+
+    Args:
+        _time: Time source.
+        milliseconds (int): Rolling window length.
+        bucket_numbers (int): Number of buckets in the window.
+        bucket_data_length (int): Values kept per bucket.
+        enabled (bool): Whether values are recorded.
+        bucket_data (type): Class recording the values of a bucket.
+        unit (str): Unit of the values, a key of :data:`UNITS`.
+    """
 
     def __init__(self, _time, milliseconds, bucket_numbers,
-                 bucket_data_length, enabled):
+                 bucket_data_length, enabled, bucket_data=None,
+                 unit='milliseconds'):
+        if unit not in UNITS:
+            raise ValueError('Unknown unit {}, expected one of {}.'.format(
+                unit, ', '.join(sorted(UNITS))))
+
         self.time = _time
         self.milliseconds = milliseconds
         self.buckets = BucketCircular(bucket_numbers)
         self.bucket_numbers = bucket_numbers
         self.bucket_data_length = bucket_data_length
+        self.bucket_data = bucket_data or PercentileBucketData
         self.enabled = enabled
-        self.snapshot = PercentileSnapshot(0)
+        self.unit = unit
+        self._ticks = UNITS[unit]
+        self.snapshot = self.bucket_data.snapshot_class(0)
+        # Buckets the snapshot is built from, set on roll while the
+        # snapshot is only built on read
+        self._snapshot_buckets = None
         self._new_bucket_lock = RLock()
 
     def buckets_size_in_milliseconds(self):
@@ -38,7 +101,8 @@ class RollingPercentile(object):
             # If we didn't find the current bucket above, then we have to
             # create one.
             if self.buckets.peek_last() is None:
-                new_bucket = Bucket(current_time, self.bucket_data_length)
+                new_bucket = Bucket(current_time, self.bucket_data_length,
+                                    self.bucket_data)
                 self.buckets.add_last(new_bucket)
                 return new_bucket
             else:
@@ -50,9 +114,8 @@ class RollingPercentile(object):
                         self.reset()
                         return self.current_bucket()
                     else:
-                        all_buckets = [b for b in self.buckets]
-                        self.buckets.add_last(Bucket(last_bucket.window_start + self.buckets_size_in_milliseconds(), self.bucket_data_length))
-                        self.snapshot = PercentileSnapshot(*all_buckets)
+                        self._snapshot_buckets = tuple(self.buckets)
+                        self.buckets.add_last(Bucket(last_bucket.window_start + self.buckets_size_in_milliseconds(), self.bucket_data_length, self.bucket_data))
 
                 return self.buckets.peek_last()
 
@@ -78,6 +141,18 @@ class RollingPercentile(object):
         for value in values:
             self.current_bucket().data.add_value(value)
 
+    def add_duration(self, *seconds):
+        ''' Add durations given in seconds, such as the difference of two
+        :func:`time.perf_counter` readings, converted to :attr:`unit`.
+        '''
+
+        if not self.enabled:
+            return
+
+        ticks = self._ticks
+        self.add_value(*[int(round(duration * ticks))
+                         for duration in seconds])
+
     def percentile(self, percentile):
         if not self.enabled:
             return -1
@@ -89,8 +164,52 @@ class RollingPercentile(object):
         # Fetch the current snapshot
         return self.current_percentile_snapshot().percentile(percentile)
 
+    def percentiles(self, percentiles):
+        """ Several percentiles, the mean, min and max read from the same
+        snapshot, moving the buckets forward only once.
+
+            >>> summary = rolling.percentiles([50, 90, 99, 99.5, 99.9])
+            >>> summary.percentile(99), summary.mean(), summary.max()
+
+        Args:
+            percentiles (list): Percentiles to compute.
+
+        Returns:
+            :class:`PercentileSummary`: Values, all ``-1`` when disabled.
+        """
+        if not self.enabled:
+            return PercentileSummary(dict((p, -1) for p in percentiles),
+                                     -1, -1, -1)
+
+        # Force logic to move buckets forward in case other requests aren't
+        # making it happen
+        self.current_bucket()
+
+        snapshot = self.current_percentile_snapshot()
+        return PercentileSummary(
+            dict(zip(percentiles, snapshot.percentiles(percentiles))),
+            snapshot.mean(), snapshot.min(), snapshot.max())
+
     def current_percentile_snapshot(self):
-        return self.snapshot
+        buckets = self._snapshot_buckets
+        if buckets is None:
+            return self.snapshot
+
+        # Built outside the lock, only published if no roll happened
+        # meanwhile
+        snapshot = self.bucket_data.snapshot_class(*buckets)
+        with self._new_bucket_lock:
+            if self._snapshot_buckets is buckets:
+                self.snapshot = snapshot
+                self._snapshot_buckets = None
+        return snapshot
+
+    def reset(self):
+        """ Clear all buckets and the snapshot. """
+        with self._new_bucket_lock:
+            self.buckets.clear()
+            self.snapshot = self.bucket_data.snapshot_class(0)
+            self._snapshot_buckets = None
 
     def mean(self):
         if not self.enabled:
@@ -104,85 +223,198 @@ class RollingPercentile(object):
         return self.current_percentile_snapshot().mean()
 
 
+class PercentileSummary(object):
+    """ Values returned by :meth:`RollingPercentile.percentiles`. """
+
+    __slots__ = ('_percentiles', '_mean', '_min', '_max')
+
+    def __init__(self, percentiles, mean, minimum, maximum):
+        self._percentiles = percentiles
+        self._mean = mean
+        self._min = minimum
+        self._max = maximum
+
+    def percentile(self, percentile):
+        return self._percentiles[percentile]
+
+    def percentiles(self):
+        """ Computed percentiles keyed by percentile. """
+        return dict(self._percentiles)
+
+    def mean(self):
+        return self._mean
+
+    def min(self):
+        return self._min
+
+    def max(self):
+        return self._max
+
+
 class Bucket(object):
     ''' Counters for a given 'bucket' of time. '''
 
-    def __init__(self, start_time, bucket_data_length):
+    def __init__(self, start_time, bucket_data_length, bucket_data=None):
         self.window_start = start_time
-        self.data = PercentileBucketData(bucket_data_length)
+        self.data = (bucket_data or PercentileBucketData)(bucket_data_length)
 
 
 class PercentileBucketData(object):
+    """ Last ``data_length`` values recorded in a bucket.
+
+    Values are written to a plain 64-bit :class:`array.array` at the position
+    claimed from an :func:`itertools.count`, which hands out each position
+    once even across threads without taking a lock. Each write to one of
+    the first ``data_length`` positions then appends to :attr:`filled`, so
+    :meth:`length` counts completed writes and never goes backwards.
+
+    Args:
+        data_length (int): Number of values kept.
+    """
+
+    # Set once PercentileSnapshot is defined
+    snapshot_class = None
 
     def __init__(self, data_length):
         self.data_length = data_length
-        self.list = Array('i', self.data_length, lock=RLock())
-        # TODO: Change this to use a generator
+        self.list = self._allocate(data_length)
         self.index = itertools.count()
-        self.number = 0
+        self.filled = bytearray()
+
+    def _allocate(self, data_length):
+        return array('q', [0]) * data_length
 
     def add_value(self, *latencies):
         # We just wrap around the beginning and over-write if we go past
         # 'data_length' as that will effectively cause us to "sample" the
         # most recent data
         for latency in latencies:
-            self.number = next(self.index)
-            self.list[self.number % self.data_length] = latency
-            self.number = self.number + 1
+            number = next(self.index)
+            self.list[number % self.data_length] = latency
+            if number < self.data_length:
+                self.filled.append(1)
 
     def length(self):
-        if self.number > len(self.list):
-            return len(self.list)
-        else:
-            return self.number
+        return len(self.filled)
+
+    def values(self):
+        """ Recorded values, in no particular order.
+
+        Returns:
+            list: Values.
+        """
+        return self.list[:self.length()]
+
+    def buffer(self):
+        """ Storage of the values, supporting the buffer protocol, only the
+        first :meth:`length` items are recorded values.
+        """
+        return self.list
+
+
+class ReservoirBucketData(PercentileBucketData):
+    """ Uniform sample of ``data_length`` values among all the values
+    recorded in a bucket.
+
+    :class:`PercentileBucketData` overwrites the oldest values once full, so
+    under high load its percentiles only describe the end of the bucket
+    interval. This keeps the first ``data_length`` values then replaces a
+    random one with the n-th value with probability ``data_length / n``
+    (Algorithm R), each value of the interval has the same chance to be in
+    the sample.
+    """
+
+    def add_value(self, *latencies):
+        for latency in latencies:
+            number = next(self.index)
+            if number < self.data_length:
+                self.list[number] = latency
+                self.filled.append(1)
+            else:
+                position = int(random.random() * (number + 1))
+                if position < self.data_length:
+                    self.list[position] = latency
+
+
+class SharedPercentileBucketData(PercentileBucketData):
+    """ :class:`PercentileBucketData` kept in a
+    :func:`multiprocessing.Array`, for buckets shared with child processes.
+
+    The write position and the number of filled positions are kept in
+    shared memory too, every write takes the process-shared lock of the
+    array to claim its position. Every bucket also allocates shared memory
+    mappings, only use it when values are recorded from several processes.
+    """
+
+    def __init__(self, data_length):
+        super(SharedPercentileBucketData, self).__init__(data_length)
+        self._cursor = multiprocessing.Value('q', 0, lock=False)
+        self._filled = multiprocessing.Value('q', 0, lock=False)
+
+    def _allocate(self, data_length):
+        return multiprocessing.Array('q', data_length,
+                                     lock=multiprocessing.RLock())
+
+    def add_value(self, *latencies):
+        values = self.list.get_obj()
+        cursor = self._cursor
+        with self.list.get_lock():
+            for latency in latencies:
+                number = cursor.value
+                cursor.value = number + 1
+                values[number % self.data_length] = latency
+                if number < self.data_length:
+                    self._filled.value += 1
+
+    def length(self):
+        return self._filled.value
+
+    def buffer(self):
+        return self.list.get_obj()
 
 
 class PercentileSnapshot(object):
+    """ Percentiles of the :class:`PercentileBucketData` of many buckets,
+    or of the given values.
+
+    The values are gathered and sorted once. With NumPy available they are
+    gathered with a single concatenation of the bucket buffers and sorted
+    by :func:`numpy.sort`.
+    """
 
     def __init__(self, *args):
-        self.data = Array('i', 0, lock=RLock())
+        self.buckets = []
+        self.data = []
         self._mean = 0
         self.length = 0
 
-        if isinstance(args[0], int):
-            self.data = list(args)
-            self.length = len(args)
-            self.buckets = []
-
-            _sum = 0
-            for d in self.data:
-                _sum += d
-
-            self._mean = _sum / self.length
-            self.data = Array('i', sorted(sorted(self.data), key=bool,
-                                          reverse=True), lock=RLock())
-
-        elif isinstance(args[0], Bucket):
-            self.length_from_buckets = 0
+        if args and isinstance(args[0], Bucket):
             self.buckets = args
-            for bucket in self.buckets:
-                self.length_from_buckets += bucket.data.data_length
-
-            self.data = Array('i', self.length_from_buckets, lock=RLock())
-            _sum = 0
-            index = 0
-            for bucket in self.buckets:
-                pbd = bucket.data
-                length = pbd.length()
-                for i in range(length):
-                    v = pbd.list[i]
-                    self.data[index] = v
-                    index += 1
-                    _sum += v
-
-            self.length = index
-            if self.length == 0:
-                self._mean = 0
+            if numpy is not None:
+                chunks = [numpy.frombuffer(bucket.data.buffer(),
+                                           dtype=numpy.int64,
+                                           count=bucket.data.length())
+                          for bucket in self.buckets]
+                data = numpy.concatenate(chunks) if chunks else \
+                    numpy.zeros(0, dtype=numpy.int64)
             else:
-                self._mean = _sum / self.length
-
-            self.data = Array('i', sorted(sorted(self.data), key=bool,
-                                          reverse=True), lock=RLock())
+                data = []
+                for bucket in self.buckets:
+                    data.extend(bucket.data.values())
+        else:
+            data = list(args)
+            if numpy is not None:
+                data = numpy.array(data, dtype=numpy.int64)
+
+        self.length = len(data)
+        if numpy is not None:
+            self.data = numpy.sort(data)
+            if self.length:
+                self._mean = float(self.data.mean())
+        else:
+            self.data = sorted(data)
+            if self.length:
+                self._mean = sum(self.data) / self.length
 
     def percentile(self, percentile):
         if self.length == 0:
@@ -194,9 +426,9 @@ class PercentileSnapshot(object):
         if self.length <= 0:
             return 0
         elif percent <= 0.0:
-            return self.data[0]
+            return int(self.data[0])
         elif percent >= 100.0:
-            return self.data[self.length - 1]
+            return int(self.data[self.length - 1])
 
         rank = (percent / 100.0) * self.length
 
@@ -209,12 +441,226 @@ class PercentileSnapshot(object):
 
         if ihigh >= self.length:
             # Another edge case
-            return self.data[self.length - 1]
+            return int(self.data[self.length - 1])
         elif ilow == ihigh:
-            return self.data[ilow]
+            return int(self.data[ilow])
         else:
             # Interpolate between the two bounding values
             return int(self.data[ilow] + (rank - ilow) * (self.data[ihigh] - self.data[ilow]))
 
+    def percentiles(self, percentiles):
+        return [self.percentile(percentile) for percentile in percentiles]
+
+    def mean(self):
+        return int(self._mean)
+
+    def min(self):
+        return int(self.data[0]) if self.length else 0
+
+    def max(self):
+        return int(self.data[self.length - 1]) if self.length else 0
+
+
+PercentileBucketData.snapshot_class = PercentileSnapshot
+
+
+class HistogramBucketData(object):
+    """ Values counted in a log-linear histogram, as HdrHistogram does.
+
+    Values below ``2 ** precision`` get a counter each. Above, every power
+    of two range is split into ``2 ** (precision - 1)`` counters of equal
+    width, so a value is known within ``2 ** (1 - precision)`` of itself
+    (under 1.6% with the default precision of 7). Recording is a couple of
+    bit operations and an increment, memory only depends on
+    :attr:`precision` and :attr:`highest`, values above :attr:`highest`
+    are counted as :attr:`highest` and negative values as ``0``.
+
+    Args:
+        data_length (int): Unused, accepted so the class can be used as the
+            ``bucket_data`` of a :class:`RollingPercentile`.
+    """
+
+    snapshot_class = None
+    precision = 7
+    highest = 2 ** 63 - 1
+
+    def __init__(self, data_length=None):
+        self.data_length = data_length
+        self.counts = array('q', [0]) * (self.index(self.highest) + 1)
+        self.total = 0
+
+    @classmethod
+    def index(klass, value):
+        """ Index of the counter of ``value``. """
+        shift = value.bit_length() - klass.precision
+        if shift <= 0:
+            return value
+        return (shift << (klass.precision - 1)) + (value >> shift)
+
+    @classmethod
+    def value_at(klass, index):
+        """ Middle of the range of values counted at ``index``. """
+        if index < 1 << klass.precision:
+            return index
+        shift = (index >> (klass.precision - 1)) - 1
+        lowest = (index - (shift << (klass.precision - 1))) << shift
+        return lowest + ((1 << shift) - 1) // 2
+
+    def add_value(self, *latencies):
+        for latency in latencies:
+            latency = min(max(int(latency), 0), self.highest)
+            self.counts[self.index(latency)] += 1
+            self.total += latency
+
+    def length(self):
+        return sum(self.counts)
+
+
+class HistogramSnapshot(object):
+    """ Percentiles of the :class:`HistogramBucketData` of many buckets.
+
+    The counters of the buckets are added up, percentiles then walk them
+    once, nothing is sorted. Counters are laid out by the class of the
+    bucket data, which may change :attr:`HistogramBucketData.precision` and
+    :attr:`HistogramBucketData.highest`.
+    """
+
+    def __init__(self, *args):
+        buckets = [bucket for bucket in args if isinstance(bucket, Bucket)]
+        self.data_class = type(buckets[0].data) if buckets else \
+            HistogramBucketData
+        data = self.data_class
+        self.counts = array('q', [0]) * (data.index(data.highest) + 1)
+        self.length = 0
+        self._mean = 0
+        total = 0
+
+        for bucket in buckets:
+            counts = self.counts
+            for index, count in enumerate(bucket.data.counts):
+                if count:
+                    counts[index] += count
+            total += bucket.data.total
+
+        self.length = sum(self.counts)
+        if self.length:
+            self._mean = total / self.length
+
+    def percentile(self, percentile):
+        return self.percentiles([percentile])[0]
+
+    def percentiles(self, percentiles):
+        """ Percentiles computed with a single walk of the counters. """
+        if self.length == 0:
+            return [0] * len(percentiles)
+
+        # Rank of each value, counting from 1, at least the first one
+        ranks = sorted(
+            (max(int(math.ceil(percentile / 100.0 * self.length)), 1),
+             position) for position, percentile in enumerate(percentiles))
+        values = [0] * len(percentiles)
+
+        value_at = self.data_class.value_at
+        seen = 0
+        pending = iter(ranks)
+        rank, position = next(pending)
+        for index, count in enumerate(self.counts):
+            seen += count
+            while seen >= rank:
+                values[position] = value_at(index)
+                try:
+                    rank, position = next(pending)
+                except StopIteration:
+                    return values
+
+        # Ranks past the last value
+        values[position] = value_at(index)
+        for rank, position in pending:
+            values[position] = value_at(index)
+        return values
+
     def mean(self):
         return int(self._mean)
+
+    def min(self):
+        return self.percentile(0)
+
+    def max(self):
+        return self.percentile(100)
+
+
+HistogramBucketData.snapshot_class = HistogramSnapshot
+
+
+class SketchBucketData(object):
+    """ Values counted in a :class:`hystrix.sketch.DDSketch`.
+
+    The sketch of the :class:`SketchSnapshot` merges the buckets of the
+    window and can be merged with the sketches of other processes, see
+    :meth:`SketchSnapshot.to_bytes`.
+
+    Args:
+        data_length (int): Unused, accepted so the class can be used as the
+            ``bucket_data`` of a :class:`RollingPercentile`.
+    """
+
+    snapshot_class = None
+    relative_accuracy = 0.01
+
+    def __init__(self, data_length=None):
+        self.data_length = data_length
+        self.sketch = DDSketch(self.relative_accuracy)
+
+    def add_value(self, *latencies):
+        for latency in latencies:
+            self.sketch.add(latency)
+
+    def length(self):
+        return self.sketch.count
+
+
+class SketchSnapshot(object):
+    """ Percentiles of the :class:`SketchBucketData` of many buckets, or of
+    a merged :class:`hystrix.sketch.DDSketch` with :meth:`from_sketch`.
+    """
+
+    def __init__(self, *args):
+        buckets = [bucket for bucket in args if isinstance(bucket, Bucket)]
+        # Sketches only merge with the same accuracy, the one of the buckets
+        self.sketch = DDSketch(buckets[0].data.sketch.relative_accuracy
+                               if buckets else
+                               SketchBucketData.relative_accuracy)
+        for bucket in buckets:
+            self.sketch.merge(bucket.data.sketch)
+        self.length = self.sketch.count
+
+    @classmethod
+    def from_sketch(klass, sketch):
+        snapshot = klass()
+        snapshot.sketch = sketch
+        snapshot.length = sketch.count
+        return snapshot
+
+    def to_bytes(self):
+        """ Serialized sketch of the window, see
+        :meth:`hystrix.sketch.DDSketch.to_bytes`.
+        """
+        return self.sketch.to_bytes()
+
+    def percentile(self, percentile):
+        return int(round(self.sketch.quantile(percentile / 100.0)))
+
+    def percentiles(self, percentiles):
+        return [self.percentile(percentile) for percentile in percentiles]
+
+    def mean(self):
+        return int(self.sketch.mean())
+
+    def min(self):
+        return self.percentile(0)
+
+    def max(self):
+        return self.percentile(100)
+
+
+SketchBucketData.snapshot_class = SketchSnapshot
@@ -0,0 +1,388 @@
+""" :class:`hystrix.rolling_number.RollingNumber` shared by the processes of
+a host through :mod:`multiprocessing.shared_memory`.
+"""
+from __future__ import absolute_import
+from threading import Lock
+import tempfile
+import logging
+import weakref
+import struct
+import errno
+import os
+
+try:
+    from multiprocessing import shared_memory, resource_tracker
+except ImportError:  # pragma: no cover
+    shared_memory = None
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+from hystrix.rolling_number import (RollingNumberEvent, RollingNumberSnapshot,
+                                    MonotonicTime)
+
+log = logging.getLogger(__name__)
+
+_MAGIC = b'HXRN'
+_HEADER = struct.Struct('<4sIIIII')
+_HEADER_SIZE = 32
+
+# Instances of the process, reinitialized in forked children
+_instances = weakref.WeakSet()
+
+
+class SharedRollingNumber(object):
+    """ :class:`hystrix.rolling_number.RollingNumber` stored in a shared
+    memory segment so every process of the host records to and reads from
+    the same counters.
+
+    The segment holds one slot per process. A process claims a free slot
+    the first time it writes, which takes a file lock once, then only ever
+    writes its own slot so writers never wait on other processes. Threads
+    of the same process share its slot and a :class:`threading.Lock`, which
+    forked children replace with their own before any of their threads
+    runs.
+
+    Each slot keeps its own buckets and cumulative sums. A slot bucket is
+    folded into the slot cumulative sums when it is reused for a newer
+    window. Readers add up (or take the max of) the buckets of every slot
+    that fall in the rolling window. Bucket windows are computed from
+    :class:`hystrix.rolling_number.MonotonicTime`, which is shared by every
+    process of the host.
+
+    Reads are not synchronized with writers of other processes, a bucket
+    being reused while read may be missed, which is acceptable for rolling
+    statistics.
+
+    The first instance with a given ``name`` creates the segment, the others
+    (and copies unpickled in :class:`concurrent.futures.ProcessPoolExecutor`
+    workers) attach to it. The creating process should :meth:`unlink` it
+    once done.
+
+    Example::
+
+        >>> counter = SharedRollingNumber('UserCommand', 10000, 10)
+        >>> metrics = CommandMetrics('UserCommand', 'UserGroup', None,
+        ...                          properties, event_notifier,
+        ...                          counter=counter)
+
+    Args:
+        name (str): Shared memory segment name.
+        milliseconds (int): Rolling window length.
+        bucket_numbers (int): Number of buckets in the window.
+        slots (int): Maximum number of writing processes.
+        events: Events class, defaults to
+            :class:`hystrix.rolling_number.RollingNumberEvent`, see
+            :meth:`hystrix.rolling_number.RollingNumberEvent.extend`.
+    """
+
+    def __init__(self, name, milliseconds, bucket_numbers, slots=64,
+                 _time=None, events=None):
+        if shared_memory is None or fcntl is None:
+            raise ImportError('SharedRollingNumber requires '
+                              'multiprocessing.shared_memory and fcntl.')
+
+        if milliseconds % bucket_numbers != 0:
+            raise Exception('The milliseconds must divide equally into '
+                            'bucket_numbers. For example 1000/10 is ok, '
+                            '1000/11 is not.')
+
+        self.name = name
+        self.time = _time or MonotonicTime()
+        self.milliseconds = milliseconds
+        self.bucket_numbers = bucket_numbers
+        self.slots = slots
+
+        self.events = events or RollingNumberEvent
+        events = tuple(self.events.__members__.values())
+        self._events = events
+        self._length = len(events)
+        self._counters = tuple(event.ordinal for event in events
+                               if event.is_counter())
+        self._maxes = tuple(event.ordinal for event in events
+                            if event.is_max_updater())
+        self._bucket_size = milliseconds / bucket_numbers
+
+        # owner pid, bucket epochs, bucket values and cumulative sums
+        self._block = 1 + bucket_numbers + (bucket_numbers + 1) * self._length
+
+        self._memory = self._open()
+        self._view = self._memory.buf[_HEADER_SIZE:].cast('q')
+        self._lock = Lock()
+        self._pid = None
+        self._base = None
+        _instances.add(self)
+
+    def _after_fork(self):
+        # Only the forking thread exists in the child, the lock may be held
+        # by a thread that doesn't, and the slot is the parent's.
+        self._lock = Lock()
+        self._pid = None
+        self._base = None
+
+    def _open(self):
+        size = _HEADER_SIZE + 8 * self._block * self.slots
+        header = _HEADER.pack(_MAGIC, 1, self.slots, self.bucket_numbers,
+                              self._length, self.milliseconds)
+
+        try:
+            memory = shared_memory.SharedMemory(self.name, create=True,
+                                                size=size)
+        except FileExistsError:
+            memory = shared_memory.SharedMemory(self.name)
+            created = False
+        else:
+            created = True
+
+        # The segment outlives the processes using it until unlink(), the
+        # resource tracker would destroy it when the first of them exits.
+        resource_tracker.unregister(memory._name, 'shared_memory')
+
+        if not created:
+            if bytes(memory.buf[:_HEADER.size]) != header:
+                memory.close()
+                raise Exception('Shared memory {} holds a different '
+                                'RollingNumber.'.format(self.name))
+            return memory
+
+        memory.buf[:_HEADER.size] = header
+        return memory
+
+    def __reduce__(self):
+        return (type(self), (self.name, self.milliseconds,
+                             self.bucket_numbers, self.slots, None,
+                             None if self.events is RollingNumberEvent
+                             else self.events))
+
+    def close(self):
+        """ Detach from the shared memory segment. """
+        self._view.release()
+        self._memory.close()
+
+    def unlink(self):
+        """ Destroy the shared memory segment. """
+        # Balances the unregister() done when opening
+        resource_tracker.register(self._memory._name, 'shared_memory')
+        self._memory.unlink()
+
+    def buckets_size_in_milliseconds(self):
+        return self._bucket_size
+
+    def _claim(self):
+        # Claim the slot of the current process, once per process, called
+        # with the lock held.
+        pid = os.getpid()
+        view = self._view
+        path = os.path.join(tempfile.gettempdir(),
+                            '{}.lock'.format(self.name.strip('/')))
+
+        with open(path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                owners = [view[slot * self._block]
+                          for slot in range(self.slots)]
+                if pid in owners:
+                    slot = owners.index(pid)
+                elif 0 in owners:
+                    slot = owners.index(0)
+                else:
+                    # Slots of exited processes are taken over along with
+                    # their counts.
+                    for slot, owner in enumerate(owners):
+                        if not _is_alive(owner):
+                            break
+                    else:
+                        raise Exception('All {} slots of {} are in use.'
+                                        .format(self.slots, self.name))
+                view[slot * self._block] = pid
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+        self._base = slot * self._block
+        self._pid = pid
+
+    def _epoch(self):
+        return int(self.time.current_time_in_millis() // self._bucket_size)
+
+    def _retire(self, base, index):
+        # Fold a slot bucket into the slot cumulative sums and empty it.
+        view = self._view
+        n = self.bucket_numbers
+        values = base + 1 + n + index * self._length
+        cumulative = base + 1 + n + n * self._length
+
+        for ordinal in self._counters:
+            view[cumulative + ordinal] += view[values + ordinal]
+        for ordinal in self._maxes:
+            view[cumulative + ordinal] = max(view[cumulative + ordinal],
+                                             view[values + ordinal])
+        for ordinal in range(self._length):
+            view[values + ordinal] = 0
+        view[base + 1 + index] = 0
+
+    def _member(self, event):
+        try:
+            if self._events[event.ordinal] is event:
+                return
+        except IndexError:
+            pass
+        self.events.check(event)
+
+    def _record(self, values):
+        for event, _ in values:
+            self._member(event)
+
+        view = self._view
+        n = self.bucket_numbers
+
+        with self._lock:
+            if self._pid != os.getpid():
+                self._claim()
+            base = self._base
+
+            epoch = self._epoch()
+            index = epoch % n
+            # Epochs are stored plus one so a zeroed segment reads as empty
+            stored = view[base + 1 + index] - 1
+            if stored < epoch:
+                if stored >= 0:
+                    self._retire(base, index)
+                view[base + 1 + index] = epoch + 1
+
+            bucket = base + 1 + n + index * self._length
+            for event, value in values:
+                offset = bucket + event.ordinal
+                if event.is_counter():
+                    view[offset] += value
+                elif event.is_max_updater():
+                    if value > view[offset]:
+                        view[offset] = value
+                else:
+                    raise Exception('Unknown type of event.')
+
+    def increment(self, event):
+        self._record(((event, 1),))
+
+    def add(self, event, value):
+        self._record(((event, value),))
+
+    def record_many(self, values):
+        self._record(values.items())
+
+    def update_rolling_max(self, event, value):
+        self._record(((event, value),))
+
+    def reset(self):
+        """ Reset the rolling **counters** of every process.
+
+        The buckets are folded into the cumulative sums. Writers of other
+        processes aren't stopped while resetting, their concurrent updates
+        may be lost.
+        """
+        with self._lock:
+            for slot in range(self.slots):
+                base = slot * self._block
+                if self._view[base] == 0:
+                    continue
+                for index in range(self.bucket_numbers):
+                    if self._view[base + 1 + index]:
+                        self._retire(base, index)
+
+    def _buckets(self):
+        # (epoch, values offset) of every bucket holding data.
+        view = self._view
+        n = self.bucket_numbers
+        buckets = []
+        for slot in range(self.slots):
+            base = slot * self._block
+            if view[base] == 0:
+                continue
+            for index in range(n):
+                epoch = view[base + 1 + index] - 1
+                if epoch >= 0:
+                    buckets.append(
+                        (epoch, base + 1 + n + index * self._length))
+        return buckets
+
+    def _cumulative(self):
+        view = self._view
+        offset = 1 + self.bucket_numbers * (1 + self._length)
+        return [slot * self._block + offset for slot in range(self.slots)
+                if view[slot * self._block]]
+
+    def _fold(self, event, offsets):
+        self._member(event)
+        ordinal = event.ordinal
+        values = [self._view[offset + ordinal] for offset in offsets]
+        if event.is_counter():
+            return sum(values)
+        if event.is_max_updater():
+            return max(values or [0])
+        raise Exception('Unknown type of event.')
+
+    def _window(self):
+        oldest = self._epoch() - self.bucket_numbers
+        return [offset for epoch, offset in self._buckets()
+                if epoch > oldest]
+
+    def rolling_sum(self, event):
+        return self._fold(event, self._window())
+
+    def rolling_max(self, event):
+        return self._fold(event, self._window())
+
+    def values(self, event):
+        epoch = self._epoch()
+        buckets = self._buckets()
+        return [self._fold(event, [offset for bucket_epoch, offset in buckets
+                                   if bucket_epoch == epoch - age])
+                for age in range(self.bucket_numbers)]
+
+    def value_of_latest_bucket(self, event):
+        epoch = self._epoch()
+        return self._fold(event, [offset for bucket_epoch, offset
+                                  in self._buckets() if bucket_epoch == epoch])
+
+    def cumulative_sum(self, event):
+        offsets = self._cumulative() + \
+            [offset for _, offset in self._buckets()]
+        return self._fold(event, offsets)
+
+    def snapshot(self, events=None):
+        buckets = self._buckets()
+        oldest = self._epoch() - self.bucket_numbers
+        window = [offset for epoch, offset in buckets if epoch > oldest]
+        everything = self._cumulative() + [offset for _, offset in buckets]
+
+        rolling = [0] * self._length
+        maximum = [0] * self._length
+        cumulative = [0] * self._length
+
+        for event in self._events if events is None else events:
+            ordinal = event.ordinal
+            if event.is_counter():
+                rolling[ordinal] = self._fold(event, window)
+            elif event.is_max_updater():
+                maximum[ordinal] = self._fold(event, window)
+            cumulative[ordinal] = self._fold(event, everything)
+
+        return RollingNumberSnapshot(rolling, maximum, cumulative)
+
+
+def _after_fork():
+    for number in list(_instances):
+        number._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as error:
+        return error.errno == errno.EPERM
+    return True
@@ -0,0 +1,155 @@
+""" Mergeable quantile sketch used by
+:class:`hystrix.rolling_percentile.SketchBucketData`.
+"""
+from __future__ import absolute_import
+import logging
+import struct
+import math
+
+log = logging.getLogger(__name__)
+
+
+class DDSketch(object):
+    """ Quantile sketch with relative accuracy guarantees (DDSketch).
+
+    A value ``v`` is counted in the bin ``ceil(log(v, gamma))`` with
+    ``gamma = (1 + relative_accuracy) / (1 - relative_accuracy)``, every
+    quantile is then known within ``relative_accuracy`` of its value.
+    Values below or at ``0`` share a single bin.
+
+    Sketches with the same ``relative_accuracy`` :meth:`merge` exactly,
+    adding up the bins gives the sketch that would have counted every value,
+    so the quantiles of many processes or hosts can be combined, unlike
+    percentiles. :meth:`to_bytes` and :meth:`from_bytes` move sketches
+    between processes.
+
+    Example::
+
+        >>> sketch = DDSketch.from_bytes(first)
+        >>> sketch.merge(DDSketch.from_bytes(second))
+        >>> sketch.quantile(0.99)
+
+    Args:
+        relative_accuracy (float): Relative error of the quantiles.
+    """
+
+    _magic = b'HXDD'
+    _header = struct.Struct('<4sBdQdI')
+    _bin = struct.Struct('<iQ')
+
+    def __init__(self, relative_accuracy=0.01):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError('relative_accuracy must be between 0 and 1')
+
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0
+
+    def add(self, value, count=1):
+        """ Count ``value`` ``count`` times. """
+        if value > 0:
+            index = int(math.ceil(math.log(value) / self._log_gamma))
+            bins = self.bins
+            try:
+                bins[index] += count
+            except KeyError:
+                bins[index] = count
+        else:
+            self.zero_count += count
+
+        self.count += count
+        self.sum += value * count
+
+    def merge(self, other):
+        """ Add the values counted by ``other``.
+
+        Raises:
+            ValueError: The sketches have different accuracies.
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('Can only merge sketches with the same '
+                             'relative_accuracy.')
+
+        bins = self.bins
+        for index, count in list(other.bins.items()):
+            bins[index] = bins.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+
+    def value_at(self, index):
+        """ Estimate of the values counted in bin ``index``. """
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def quantile(self, quantile):
+        """ Value at ``quantile``.
+
+        Args:
+            quantile (float): Between ``0`` and ``1``.
+
+        Returns:
+            float: Value, ``0`` when nothing was counted.
+        """
+        if self.count == 0:
+            return 0
+
+        rank = min(max(quantile, 0.0), 1.0) * (self.count - 1)
+        seen = self.zero_count
+        if seen > rank:
+            return 0
+
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                return self.value_at(index)
+
+        return self.value_at(max(self.bins))
+
+    def mean(self):
+        if self.count == 0:
+            return 0
+        return self.sum / self.count
+
+    def to_bytes(self):
+        """ Compact binary representation, see :meth:`from_bytes`.
+
+        Returns:
+            bytes: Header followed by 12 bytes per bin.
+        """
+        bins = sorted(self.bins.items())
+        chunks = [self._header.pack(self._magic, 1, self.relative_accuracy,
+                                    self.zero_count, self.sum, len(bins))]
+        chunks.extend(self._bin.pack(index, count) for index, count in bins)
+        return b''.join(chunks)
+
+    @classmethod
+    def from_bytes(klass, data):
+        """ Sketch from the output of :meth:`to_bytes`.
+
+        Raises:
+            ValueError: ``data`` isn't a serialized sketch.
+        """
+        try:
+            magic, version, relative_accuracy, zero_count, total, length = \
+                klass._header.unpack_from(data)
+        except struct.error:
+            raise ValueError('Not a serialized DDSketch.')
+        if magic != klass._magic or version != 1 or \
+                len(data) != klass._header.size + length * klass._bin.size:
+            raise ValueError('Not a serialized DDSketch.')
+
+        sketch = klass(relative_accuracy)
+        offset = klass._header.size
+        for _ in range(length):
+            index, count = klass._bin.unpack_from(data, offset)
+            sketch.bins[index] = count
+            sketch.count += count
+            offset += klass._bin.size
+        sketch.zero_count = zero_count
+        sketch.count += zero_count
+        sketch.sum = total
+        return sketch
@@ -125,6 +125,7 @@ setup(
     extras_require={
         'dev': dev_requires,
         'test': tests_require,
+        'numpy': ['numpy'],
     },
     cmdclass={
         "version": VersionCommand,
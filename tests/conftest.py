@@ -0,0 +1,8 @@
+import sys
+
+collect_ignore = []
+
+# async def is a SyntaxError before Python 3.5 and the tests drive the
+# event loop with asyncio.run, added in Python 3.7.
+if sys.version_info < (3, 7):
+    collect_ignore.append('test_bulkhead.py')
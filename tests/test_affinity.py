@@ -0,0 +1,19 @@
+from hystrix.affinity import (parse_cpu_list, available_cpus, cpus_for,
+                              NodeAllocator, NUMA)
+
+
+def test_parse_cpu_list():
+    assert parse_cpu_list('0-3,8,10-11\n') == {0, 1, 2, 3, 8, 10, 11}
+    assert parse_cpu_list('') == set()
+
+
+def test_node_allocator_spreads_round_robin():
+    allocator = NodeAllocator([frozenset([0, 1]), frozenset([2, 3])])
+
+    assert allocator.allocate() == frozenset([0, 1])
+    assert allocator.allocate() == frozenset([2, 3])
+    assert allocator.allocate() == frozenset([0, 1])
+
+
+def test_cpus_for_numa_is_available():
+    assert cpus_for(NUMA) <= available_cpus()
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from hystrix.bulkhead import Bulkhead, BulkheadRejectedError
+from hystrix.rolling_number import RollingNumberEvent
+
+
+def test_bulkhead_limits_concurrency():
+    bulkhead = Bulkhead('LimitGroup', max_concurrent=2, max_queue_size=10)
+    running = []
+
+    async def work():
+        running.append(bulkhead.current_active_count())
+        await asyncio.sleep(0.01)
+
+    async def main():
+        await asyncio.gather(*[bulkhead.call(work) for _ in range(6)])
+
+    asyncio.run(main())
+
+    assert max(running) == 2
+    assert bulkhead.current_active_count() == 0
+    assert bulkhead.current_completed_task_count() == 6
+    assert bulkhead.rolling_count_executed() == 6
+    assert bulkhead.cumulative_count_executed() == 6
+    assert bulkhead.rolling_max_active() == 2
+
+
+def test_bulkhead_rejects_when_queue_is_full():
+    bulkhead = Bulkhead('FullGroup', max_concurrent=1, max_queue_size=1)
+
+    async def main():
+        return await asyncio.gather(
+            *[bulkhead.call(asyncio.sleep, 0.01, 'done') for _ in range(3)],
+            return_exceptions=True)
+
+    results = asyncio.run(main())
+
+    assert results[:2] == ['done', 'done']
+    assert isinstance(results[2], BulkheadRejectedError)
+    assert bulkhead.rolling_count_rejected() == 1
+    assert bulkhead.counter.rolling_sum(
+        RollingNumberEvent.THREAD_POOL_REJECTED) == 1
+
+
+def test_bulkhead_rejects_when_wait_times_out():
+    bulkhead = Bulkhead('TimeoutGroup', max_concurrent=1, max_queue_size=1,
+                        queue_timeout=0.01)
+
+    async def main():
+        async with bulkhead:
+            with pytest.raises(BulkheadRejectedError):
+                await bulkhead.acquire()
+            assert bulkhead.current_queue_size() == 0
+
+    asyncio.run(main())
+
+    assert bulkhead.rolling_count_rejected() == 1
+
+
+def test_bulkhead_without_queue_is_semaphore_rejected():
+    bulkhead = Bulkhead('SemaphoreGroup', max_concurrent=1, max_queue_size=0)
+
+    async def main():
+        async with bulkhead:
+            with pytest.raises(BulkheadRejectedError):
+                await bulkhead.acquire()
+
+    asyncio.run(main())
+
+    assert bulkhead.counter.rolling_sum(
+        RollingNumberEvent.SEMAPHORE_REJECTED) == 1
+
+
+def test_bulkhead_get_instance():
+    bulkhead = Bulkhead.get_instance('InstanceGroup', max_concurrent=3)
+    assert Bulkhead.get_instance('InstanceGroup') is bulkhead
+    assert bulkhead.current_pool_size() == 3
@@ -1,4 +1,5 @@
 from hystrix.command import Command
+from hystrix.rolling_number import RollingNumberEvent
 
 import pytest
 
@@ -112,3 +113,17 @@ def test_command_hello_cache_callback():
     command = CacheCommand()
     future = command.observe()
     assert 'Hello Cache' == future.result()
+
+
+def test_command_custom_events():
+    CacheEvent = RollingNumberEvent.extend('CacheEvent',
+                                           counters=['CACHE_HIT'])
+
+    class CustomEventsCommand(Command):
+        events = CacheEvent
+
+    metrics = CustomEventsCommand.metrics
+    assert metrics.counter.events is CacheEvent
+
+    metrics.counter.increment(CacheEvent.CACHE_HIT)
+    assert metrics.counter.rolling_sum(CacheEvent.CACHE_HIT) == 1
@@ -1,8 +1,12 @@
 import time
 
+import pytest
+
 from hystrix.command import Command
 from hystrix.command_metrics import CommandMetrics
 from hystrix.command_properties import CommandProperties
+from hystrix.event_type import EventType
+from hystrix.rolling_number import RollingNumber, RollingNumberEvent
 from hystrix.strategy.eventnotifier.event_notifier_default import (
     EventNotifierDefault)
 
@@ -82,6 +86,30 @@ def test_bad_request_do_not_affect_error_percentage():
     assert 75 == metrics.health_counts().error_percentage()
 
 
+def test_mark_events():
+    properties = get_unit_test_properties_setter()
+    metrics = get_metrics(properties)
+
+    metrics.mark_events({EventType.SUCCESS: 7, EventType.FAILURE: 2,
+                         EventType.TIMEOUT: 1, EventType.EMIT: 3})
+
+    counter = metrics.counter
+    assert counter.rolling_sum(RollingNumberEvent.SUCCESS) == 7
+    assert counter.rolling_sum(RollingNumberEvent.FAILURE) == 2
+    assert counter.rolling_sum(RollingNumberEvent.TIMEOUT) == 1
+    assert 30 == metrics.health_counts().error_percentage()
+
+
+def test_events_with_counter():
+    counter = RollingNumber(10000, 10)
+    PaymentEvent = RollingNumberEvent.extend('PaymentEvent',
+                                             counters=['CACHE_HIT'])
+
+    with pytest.raises(ValueError):
+        CommandMetrics('command_test', 'command_test', None, properties,
+                       event_notifier, counter=counter, events=PaymentEvent)
+
+
 """
 def test_current_concurrent_exection_count():
     class LatentCommand(Command):
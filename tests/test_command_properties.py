@@ -82,3 +82,14 @@ def test_integer_code_default():
     result1 = CommandProperties.default_metrics_rolling_statistical_window
     result2 = properties.metrics_rolling_statistical_window_in_milliseconds()
     assert result1 == result2
+
+
+def test_percentile_unit():
+    setter = CommandProperties.setter()
+    properties = PropertiesCommandTest('TEST', setter, 'unitTestPrefix')
+    assert 'milliseconds' == properties.metrics_rolling_percentile_unit()
+
+    setter = CommandProperties.setter() \
+        .with_metrics_rolling_percentile_unit('microseconds')
+    properties = PropertiesCommandTest('TEST', setter, 'unitTestPrefix')
+    assert 'microseconds' == properties.metrics_rolling_percentile_unit()
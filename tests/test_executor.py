@@ -0,0 +1,96 @@
+from collections import deque
+import threading
+import time
+
+import pytest
+
+from hystrix.executor import WorkStealingExecutor
+
+
+def test_work_stealing_executor_results():
+    executor = WorkStealingExecutor(4)
+    futures = [executor.submit(pow, i, 2) for i in range(100)]
+    assert [f.result(1) for f in futures] == [i ** 2 for i in range(100)]
+    executor.shutdown()
+
+
+def test_work_stealing_executor_exception():
+    executor = WorkStealingExecutor(2)
+    future = executor.submit(int, 'not a number')
+    with pytest.raises(ValueError):
+        future.result(1)
+    executor.shutdown()
+
+
+def test_idle_worker_steals_from_busy_worker():
+    executor = WorkStealingExecutor(2)
+    release = threading.Event()
+
+    # First item goes to worker 0, second to worker 1 and third is queued
+    # behind the blocked item on worker 0.
+    blocked = executor.submit(release.wait, 5)
+    executor.submit(time.sleep, 0)
+    stolen = executor.submit(lambda: 'stolen')
+
+    assert stolen.result(1) == 'stolen'
+    assert not blocked.done()
+
+    release.set()
+    assert blocked.result(1) is True
+    executor.shutdown()
+
+
+def test_submit_after_shutdown():
+    executor = WorkStealingExecutor(1)
+    executor.shutdown()
+
+    with pytest.raises(RuntimeError):
+        executor.submit(time.sleep, 0)
+
+
+def test_items_submitted_during_shutdown_resolve():
+    for _ in range(5):
+        executor = WorkStealingExecutor(4)
+        futures = []
+
+        def submit():
+            while True:
+                try:
+                    futures.append(executor.submit(pow, 2, 3))
+                except RuntimeError:
+                    return
+
+        threads = [threading.Thread(target=submit) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.001)
+        executor.shutdown()
+        for thread in threads:
+            thread.join()
+
+        assert all(future.result(1) == 8 for future in futures)
+
+
+def test_item_queued_while_shutting_down_is_taken_back():
+    executor = WorkStealingExecutor(1)
+    started, release = threading.Event(), threading.Event()
+
+    def wait():
+        started.set()
+        return release.wait(5)
+
+    busy = executor.submit(wait)
+    started.wait(1)
+
+    class ShutdownOnAppend(deque):
+        def append(self, item):
+            super(ShutdownOnAppend, self).append(item)
+            executor.shutdown(wait=False)
+
+    executor._queues[0] = ShutdownOnAppend(executor._queues[0])
+    with pytest.raises(RuntimeError):
+        executor.submit(pow, 2, 3)
+    assert len(executor._queues[0]) == 0
+
+    release.set()
+    assert busy.result(1) is True
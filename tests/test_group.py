@@ -1,4 +1,5 @@
 from hystrix.group import Group
+from hystrix.pool import WorkStealingPool
 
 
 def test_default_groupname():
@@ -16,3 +17,11 @@ def test_manual_groupname():
 
     group = Test()
     assert group.group_key == 'MyTestGroup'
+
+
+def test_pool_class():
+    class Test(Group):
+        group_key = 'MyWorkStealingGroup'
+        pool_class = WorkStealingPool
+
+    assert isinstance(Test.pool, WorkStealingPool)
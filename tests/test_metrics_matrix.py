@@ -0,0 +1,173 @@
+import threading
+
+import pytest
+
+from hystrix.command_metrics import CommandMetrics
+from hystrix.event_type import EventType
+from hystrix.rolling_number import RollingNumberEvent
+from hystrix.strategy.eventnotifier.event_notifier_default import (
+    EventNotifierDefault)
+
+from .test_command_properties import get_unit_test_properties_setter, as_mock
+from .utils import MockedTime
+
+numpy = pytest.importorskip('numpy')
+
+from hystrix.metrics_matrix import MetricsMatrix  # noqa
+
+
+def test_counter_view():
+    _time = MockedTime()
+    matrix = MetricsMatrix(200, 10, _time=_time)
+    counter = matrix.counter('command')
+
+    assert matrix.counter('command').row == counter.row
+
+    counter.increment(RollingNumberEvent.SUCCESS)
+    counter.add(RollingNumberEvent.SUCCESS, 2)
+    counter.update_rolling_max(RollingNumberEvent.THREAD_MAX_ACTIVE, 5)
+    assert counter.rolling_sum(RollingNumberEvent.SUCCESS) == 3
+    assert counter.rolling_max(RollingNumberEvent.THREAD_MAX_ACTIVE) == 5
+
+    _time.increment(counter.buckets_size_in_milliseconds())
+    counter.record_many({RollingNumberEvent.SUCCESS: 4,
+                         RollingNumberEvent.THREAD_MAX_ACTIVE: 2})
+    assert counter.values(RollingNumberEvent.SUCCESS)[:2] == [4, 3]
+    assert counter.value_of_latest_bucket(
+        RollingNumberEvent.THREAD_MAX_ACTIVE) == 2
+    assert counter.rolling_sum(RollingNumberEvent.SUCCESS) == 7
+
+    # Past the window only the cumulative sums remain
+    _time.increment(200)
+    assert counter.rolling_sum(RollingNumberEvent.SUCCESS) == 0
+    assert counter.rolling_max(RollingNumberEvent.THREAD_MAX_ACTIVE) == 0
+    assert counter.cumulative_sum(RollingNumberEvent.SUCCESS) == 7
+    assert counter.cumulative_sum(RollingNumberEvent.THREAD_MAX_ACTIVE) == 5
+
+    counter.increment(RollingNumberEvent.SUCCESS)
+    counter.reset()
+    assert counter.rolling_sum(RollingNumberEvent.SUCCESS) == 0
+    assert counter.cumulative_sum(RollingNumberEvent.SUCCESS) == 8
+
+
+def test_rows_grow():
+    matrix = MetricsMatrix(200, 10, capacity=2, _time=MockedTime())
+    counters = [matrix.counter(key) for key in range(5)]
+    for count, counter in enumerate(counters):
+        counter.add(RollingNumberEvent.FAILURE, count)
+
+    assert matrix.keys() == list(range(5))
+    assert list(matrix.rolling()[:, RollingNumberEvent.FAILURE.ordinal]) == \
+        list(range(5))
+
+
+def test_vectorized_health():
+    matrix = MetricsMatrix(200, 10, _time=MockedTime())
+    matrix.counter('healthy').record_many({RollingNumberEvent.SUCCESS: 30})
+    matrix.counter('failing').record_many({RollingNumberEvent.SUCCESS: 7,
+                                           RollingNumberEvent.FAILURE: 2,
+                                           RollingNumberEvent.TIMEOUT: 1,
+                                           RollingNumberEvent.BAD_REQUEST: 5})
+    matrix.counter('idle')
+
+    health = matrix.health_counts()
+    assert health['healthy'].error_percentage() == 0
+    assert health['failing'].total_requests() == 10
+    assert health['failing'].error_count() == 3
+    assert health['failing'].error_percentage() == 30
+    assert health['idle'].total_requests() == 0
+
+    assert matrix.tripped(volume_threshold=10, error_threshold=30) == \
+        ['failing']
+    assert matrix.tripped(volume_threshold=20, error_threshold=30) == []
+
+
+def test_command_metrics_counter():
+    matrix = MetricsMatrix(10000, 10)
+    metrics = CommandMetrics(
+        'command_test', 'command_test', None,
+        as_mock(get_unit_test_properties_setter()),
+        EventNotifierDefault.get_instance(),
+        counter=matrix.counter('command_test'))
+
+    metrics.mark_events({EventType.SUCCESS: 3, EventType.FAILURE: 1})
+    assert metrics.health_counts().error_percentage() == 25
+    assert matrix.health_counts()['command_test'].error_percentage() == 25
+
+
+def test_concurrent_writers():
+    _time = MockedTime()
+    matrix = MetricsMatrix(200, 10, capacity=1, _time=_time)
+    start = threading.Event()
+
+    def write(key):
+        counter = matrix.counter(key)
+        start.wait()
+        for _ in range(1000):
+            counter.increment(RollingNumberEvent.SUCCESS)
+        counter.update_rolling_max(RollingNumberEvent.THREAD_MAX_ACTIVE,
+                                   len(key))
+
+    threads = [threading.Thread(target=write, args=(key,))
+               for key in ('a', 'bb', 'a', 'bb')]
+    for thread in threads:
+        thread.start()
+    start.set()
+    for thread in threads:
+        thread.join()
+
+    a, bb = matrix.counter('a'), matrix.counter('bb')
+    assert a.rolling_sum(RollingNumberEvent.SUCCESS) == 2000
+    assert bb.rolling_max(RollingNumberEvent.THREAD_MAX_ACTIVE) == 2
+
+    # The thread vectors are folded into the array when the window rolls
+    _time.increment(matrix.buckets_size_in_milliseconds())
+    assert a.values(RollingNumberEvent.SUCCESS)[:2] == [0, 2000]
+    assert list(matrix.rolling()[:, RollingNumberEvent.SUCCESS.ordinal]) == \
+        [2000, 2000]
+
+
+def test_custom_events():
+    CacheEvent = RollingNumberEvent.extend('CacheEvent',
+                                           counters=['CACHE_HIT'],
+                                           max_updaters=['SIZE_MAX'])
+    matrix = MetricsMatrix(200, 10, _time=MockedTime(), events=CacheEvent)
+    counter = matrix.counter('command')
+    counter.increment(CacheEvent.CACHE_HIT)
+    counter.update_rolling_max(CacheEvent.SIZE_MAX, 4)
+    counter.increment(RollingNumberEvent.SUCCESS)
+
+    assert counter.rolling_sum(CacheEvent.CACHE_HIT) == 1
+    assert counter.rolling_max(CacheEvent.SIZE_MAX) == 4
+    assert counter.snapshot().rolling_sum(CacheEvent.CACHE_HIT) == 1
+    assert matrix.health_counts()['command'].total_requests() == 1
+
+
+def test_foreign_events_are_rejected():
+    First = RollingNumberEvent.extend('First', counters=['X'])
+    Second = RollingNumberEvent.extend('Second', counters=['Y'])
+    counter = MetricsMatrix(200, 10, _time=MockedTime(),
+                            events=First).counter('command')
+
+    with pytest.raises(Exception):
+        counter.increment(Second.Y)
+    with pytest.raises(Exception):
+        counter.record_many({Second.Y: 2})
+    assert counter.rolling_sum(First.X) == 0
+
+
+def test_health_matches_command_metrics():
+    matrix = MetricsMatrix(10000, 10)
+    metrics = CommandMetrics(
+        'command_test', 'command_test', None,
+        as_mock(get_unit_test_properties_setter()),
+        EventNotifierDefault.get_instance(),
+        counter=matrix.counter('command_test'))
+
+    # 29 / 100 * 100 is just below 29 in floating point
+    metrics.mark_events({EventType.SUCCESS: 71, EventType.FAILURE: 29})
+    expected = metrics.health_counts().error_percentage()
+    assert matrix.health_counts()['command_test'].error_percentage() == \
+        expected
+    assert matrix.tripped(volume_threshold=0,
+                          error_threshold=expected + 1) == []
@@ -1,4 +1,13 @@
-from hystrix.pool import Pool
+import threading
+import sys
+import os
+
+import pytest
+
+import hystrix
+from hystrix.command import Command
+from hystrix.pool import Pool, WorkStealingPool
+from hystrix.affinity import available_cpus
 
 
 def test_default_poolname():
@@ -16,3 +25,70 @@ def test_manual_poolname():
 
     pool = Test()
     assert pool.pool_key == 'MyTestPool'
+
+
+def worker_affinity():
+    return os.sched_getaffinity(0)
+
+
+@pytest.mark.skipif(not hasattr(os, 'sched_setaffinity'),
+                    reason='CPU affinity is not supported on this platform')
+@pytest.mark.skipif(sys.version_info < (3, 7),
+                    reason='ProcessPoolExecutor initializer requires 3.7')
+def test_cpu_affinity():
+    cpus = frozenset([min(available_cpus())])
+
+    class Pinned(Pool):
+        cpu_affinity = cpus
+
+    pool = Pinned()
+    assert pool.cpus == cpus
+    assert pool.submit(worker_affinity).result() == cpus
+    pool.shutdown()
+
+
+def test_work_stealing_pool():
+    class Test(WorkStealingPool):
+        pass
+
+    pool = Test()
+    assert pool.pool_key == 'TestPool'
+    assert pool.submit(pow, 2, 3).result(1) == 8
+    pool.shutdown()
+
+
+class DrainCommand(Command):
+    def run(self):
+        return 'Hello Run'
+
+    def fallback(self):
+        return 'Hello Fallback'
+
+
+def test_shutdown_drains_pools_and_commands_fall_back():
+    command = DrainCommand()
+    assert command.execute() == 'Hello Run'
+
+    assert hystrix.shutdown(5, pools=[command.group.pool]) is True
+
+    with pytest.raises(RuntimeError):
+        command.group.pool.submit(pow, 2, 3)
+
+    assert command.execute() == 'Hello Fallback'
+    assert command.queue().result() == 'Hello Fallback'
+
+
+def test_shutdown_cancels_queued_work_after_timeout():
+    class Slow(WorkStealingPool):
+        pass
+
+    pool = Slow(max_workers=1)
+    release = threading.Event()
+    running = pool.submit(release.wait, 5)
+    queued = pool.submit(pow, 2, 3)
+
+    assert hystrix.shutdown(0.1, pools=[pool]) is False
+    assert queued.cancelled()
+
+    release.set()
+    assert running.result(1) is True
@@ -1,8 +1,17 @@
+import threading
+import weakref
+import time
+import gc
+import os
+
 import pytest
+import six
 
 from .utils import MockedTime
 
-from hystrix.rolling_number import RollingNumber, RollingNumberEvent
+from hystrix.rolling_number import (RollingNumber, RollingNumberEvent,
+                                    LongAdder, LongMaxUpdater, Bucket,
+                                    MonotonicTime, CoarseTime, EventMetaclass)
 
 
 def test_create_buckets():
@@ -370,6 +379,21 @@ def test_max_value():
     # The count should be max
     counter.update_rolling_max(event, 40)
 
+    # The rolling max is the max across buckets, not the latest or oldest
+    assert counter.rolling_max(event) == 40
+    assert counter.value_of_latest_bucket(event) == 40
+
+    # Once the bucket holding 40s rolls out the max drops
+    _time.increment(counter.buckets_size_in_milliseconds())
+    counter.update_rolling_max(event, 5)
+    assert counter.rolling_max(event) == 40
+
+    _time.increment(counter.buckets_size_in_milliseconds() * 8)
+    assert counter.rolling_max(event) == 40
+
+    _time.increment(counter.buckets_size_in_milliseconds())
+    assert counter.rolling_max(event) == 5
+
 
 def test_empty_sum():
     _time = MockedTime()
@@ -526,6 +550,186 @@ def test_rolling_number_event_is_max_updater():
     assert event.is_max_updater() is True
 
 
+def test_long_adder_concurrent_increments():
+    adder = LongAdder()
+
+    def increment():
+        for _ in range(10000):
+            adder.increment()
+
+    threads = [threading.Thread(target=increment) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert adder.sum() == 80000
+
+    adder.add(5)
+    adder.decrement()
+    assert adder.sum() == 80004
+
+
+def test_long_max_updater_keeps_max_across_threads():
+    updater = LongMaxUpdater()
+    assert updater.max() == 0
+
+    threads = [threading.Thread(target=updater.update, args=(value,))
+               for value in (3, 42, 7)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    updater.update(10)
+    assert updater.max() == 42
+
+
+def test_buckets_are_reused_in_place():
+    _time = MockedTime()
+    counter = RollingNumber(20, 2, _time=_time)
+    event = RollingNumberEvent.SUCCESS
+
+    counter.increment(event)
+    first = counter.current_bucket()
+
+    _time.increment(counter.buckets_size_in_milliseconds())
+    counter.increment(event)
+    second = counter.current_bucket()
+    assert second is not first
+
+    # Third bucket takes the slot of the first one, reset in place
+    _time.increment(counter.buckets_size_in_milliseconds())
+    assert counter.current_bucket() is first
+    assert first.get(event) == 0
+    assert first.window_start == 20
+    assert counter.rolling_sum(event) == 1
+    assert counter.cumulative_sum(event) == 2
+
+
+def test_rolling_sum_matches_bucket_values():
+    _time = MockedTime()
+    counter = RollingNumber(100, 10, _time=_time)
+    event = RollingNumberEvent.SUCCESS
+    steps = [0, 3, 10, 10, 25, 7, 0, 50, 1, 99, 120, 10, 10, 10, 4]
+
+    for step, increments in zip(steps, range(1, len(steps) + 1)):
+        _time.increment(step)
+        for _ in range(increments):
+            counter.increment(event)
+        assert counter.rolling_sum(event) == sum(counter.values(event))
+
+    assert counter.cumulative_sum(event) == sum(range(1, len(steps) + 1))
+
+
+def test_snapshot():
+    _time = MockedTime()
+    counter = RollingNumber(200, 10, _time=_time)
+
+    counter.increment(RollingNumberEvent.SUCCESS)
+    counter.increment(RollingNumberEvent.FAILURE)
+    counter.update_rolling_max(RollingNumberEvent.THREAD_MAX_ACTIVE, 30)
+
+    _time.increment(counter.buckets_size_in_milliseconds())
+    counter.increment(RollingNumberEvent.SUCCESS)
+    counter.update_rolling_max(RollingNumberEvent.THREAD_MAX_ACTIVE, 10)
+
+    snapshot = counter.snapshot()
+    assert snapshot.rolling_sum(RollingNumberEvent.SUCCESS) == 2
+    assert snapshot.rolling_sum(RollingNumberEvent.FAILURE) == 1
+    assert snapshot.cumulative_sum(RollingNumberEvent.SUCCESS) == 2
+    assert snapshot.rolling_max(RollingNumberEvent.THREAD_MAX_ACTIVE) == 30
+
+    # Immutable, later writes don't change it
+    counter.increment(RollingNumberEvent.SUCCESS)
+    assert snapshot.rolling_sum(RollingNumberEvent.SUCCESS) == 2
+    with pytest.raises(AttributeError):
+        snapshot.extra = 1
+
+    # Only the requested events are read
+    snapshot = counter.snapshot([RollingNumberEvent.FAILURE])
+    assert snapshot.rolling_sum(RollingNumberEvent.FAILURE) == 1
+    assert snapshot.rolling_sum(RollingNumberEvent.SUCCESS) == 0
+
+    # Window passed
+    _time.increment(counter.milliseconds)
+    assert counter.snapshot().rolling_sum(RollingNumberEvent.SUCCESS) == 0
+    assert counter.snapshot().cumulative_sum(RollingNumberEvent.SUCCESS) == 3
+
+
+def test_event_ordinals_follow_definition_order():
+    members = list(RollingNumberEvent.__members__.values())
+    assert [event.ordinal for event in members] == list(range(len(members)))
+    assert RollingNumberEvent.SUCCESS.ordinal == 0
+
+
+def test_custom_events():
+    PaymentEvent = RollingNumberEvent.extend(
+        'PaymentEvent', counters=['CACHE_HIT_L1', 'CACHE_HIT_L2'],
+        max_updaters=['PAYLOAD_SIZE_MAX'])
+
+    assert PaymentEvent.__name__ == 'PaymentEvent'
+    assert PaymentEvent.SUCCESS is RollingNumberEvent.SUCCESS
+    assert PaymentEvent.CACHE_HIT_L1.ordinal == \
+        len(RollingNumberEvent.__members__)
+    assert PaymentEvent.PAYLOAD_SIZE_MAX.is_max_updater()
+    assert not hasattr(RollingNumberEvent, 'CACHE_HIT_L1')
+
+    _time = MockedTime()
+    counter = RollingNumber(200, 10, _time=_time, events=PaymentEvent)
+    counter.increment(PaymentEvent.SUCCESS)
+    counter.add(PaymentEvent.CACHE_HIT_L2, 4)
+    counter.update_rolling_max(PaymentEvent.PAYLOAD_SIZE_MAX, 512)
+    _time.increment(counter.buckets_size_in_milliseconds())
+    counter.update_rolling_max(PaymentEvent.PAYLOAD_SIZE_MAX, 128)
+
+    assert counter.rolling_sum(RollingNumberEvent.SUCCESS) == 1
+    assert counter.rolling_sum(PaymentEvent.CACHE_HIT_L2) == 4
+    assert counter.rolling_max(PaymentEvent.PAYLOAD_SIZE_MAX) == 512
+    assert counter.cumulative_sum(PaymentEvent.CACHE_HIT_L2) == 4
+
+
+def test_events_of_their_own():
+    class TierEvent(six.with_metaclass(EventMetaclass, object)):
+        HIT = 1
+        MISS = 1
+
+    counter = RollingNumber(200, 10, _time=MockedTime(), events=TierEvent)
+    counter.increment(TierEvent.MISS)
+
+    assert len(counter.buckets.peek_last().folded) == 2
+    assert counter.rolling_sum(TierEvent.MISS) == 1
+    assert counter.rolling_sum(TierEvent.HIT) == 0
+
+    with pytest.raises(Exception):
+        RollingNumberEvent.extend('Duplicated', counters=['SUCCESS'])
+
+
+def test_bucket_keeps_one_vector_per_thread():
+    bucket = Bucket(0)
+
+    def record():
+        for _ in range(1000):
+            bucket.add(RollingNumberEvent.SUCCESS, 1)
+        bucket.update_max(RollingNumberEvent.THREAD_MAX_ACTIVE, 7)
+
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    bucket.add(RollingNumberEvent.FAILURE, 3)
+
+    assert bucket.get(RollingNumberEvent.SUCCESS) == 4000
+    assert bucket.get(RollingNumberEvent.FAILURE) == 3
+    assert bucket.get(RollingNumberEvent.THREAD_MAX_ACTIVE) == 7
+    assert not hasattr(bucket, '__dict__')
+
+    with pytest.raises(Exception):
+        bucket.adder(RollingNumberEvent.THREAD_MAX_ACTIVE)
+
+
 def counter_event(event):
     _time = MockedTime()
     counter = RollingNumber(200, 10, _time=_time)
@@ -560,3 +764,218 @@ def counter_event(event):
 
     # The total count
     assert counter.rolling_sum(event) == 2
+
+
+def test_monotonic_time_never_goes_backwards():
+    _time = MonotonicTime()
+    previous = _time.current_time_in_millis()
+    for _ in range(1000):
+        current = _time.current_time_in_millis()
+        assert current >= previous
+        previous = current
+
+
+def test_coarse_time_is_refreshed_in_background():
+    _time = CoarseTime(resolution=0.001)
+    try:
+        first = _time.current_time_in_millis()
+        time.sleep(0.05)
+        assert _time.current_time_in_millis() > first
+        assert abs(_time.current_time_in_millis() -
+                   MonotonicTime().current_time_in_millis()) < 50
+    finally:
+        _time.stop()
+
+
+def test_rolling_number_with_coarse_time():
+    counter = RollingNumber(10000, 10, _time=CoarseTime.get_instance())
+    counter.increment(RollingNumberEvent.SUCCESS)
+    assert counter.rolling_sum(RollingNumberEvent.SUCCESS) == 1
+
+
+def test_add_and_record_many():
+    _time = MockedTime()
+    counter = RollingNumber(200, 10, _time=_time)
+
+    counter.add(RollingNumberEvent.SUCCESS, 5)
+    counter.record_many({RollingNumberEvent.SUCCESS: 3,
+                         RollingNumberEvent.FAILURE: 2,
+                         RollingNumberEvent.THREAD_MAX_ACTIVE: 4})
+    counter.record_many({RollingNumberEvent.THREAD_MAX_ACTIVE: 1})
+
+    assert len(counter.buckets) == 1
+    assert counter.rolling_sum(RollingNumberEvent.SUCCESS) == 8
+    assert counter.rolling_sum(RollingNumberEvent.FAILURE) == 2
+    assert counter.rolling_max(RollingNumberEvent.THREAD_MAX_ACTIVE) == 4
+
+    _time.increment(counter.buckets_size_in_milliseconds())
+    counter.record_many({RollingNumberEvent.SUCCESS: 10})
+
+    assert len(counter.buckets) == 2
+    assert counter.rolling_sum(RollingNumberEvent.SUCCESS) == 18
+    assert counter.cumulative_sum(RollingNumberEvent.SUCCESS) == 18
+
+
+def test_rollups():
+    _time = MockedTime()
+    counter = RollingNumber(1000, 10, _time=_time,
+                            rollups=[(6000, 6), (60000, 6)])
+
+    # One success and an increasing max every 100ms for 6 seconds
+    for i in range(60):
+        counter.increment(RollingNumberEvent.SUCCESS)
+        counter.update_rolling_max(RollingNumberEvent.THREAD_MAX_ACTIVE, i)
+        _time.increment(100)
+    counter.increment(RollingNumberEvent.SUCCESS)
+
+    assert counter.rolling_sum(RollingNumberEvent.SUCCESS) == 10
+    assert counter.rolling_sum(RollingNumberEvent.SUCCESS, 6000) == 51
+    assert counter.rolling_sum(RollingNumberEvent.SUCCESS, 60000) == 61
+    assert counter.rolling_max(RollingNumberEvent.THREAD_MAX_ACTIVE) == 59
+    assert counter.rolling_max(RollingNumberEvent.THREAD_MAX_ACTIVE,
+                               60000) == 59
+
+    # Reset only clears the main window
+    counter.reset()
+    assert counter.rolling_sum(RollingNumberEvent.SUCCESS) == 0
+    assert counter.rolling_sum(RollingNumberEvent.SUCCESS, 60000) == 61
+
+    # Long after, all windows are empty
+    _time.increment(60000)
+    assert counter.rolling_sum(RollingNumberEvent.SUCCESS, 6000) == 0
+    assert counter.rolling_sum(RollingNumberEvent.SUCCESS, 60000) == 0
+    assert counter.cumulative_sum(RollingNumberEvent.SUCCESS) == 61
+
+
+def test_rollups_must_align_with_buckets():
+    with pytest.raises(Exception):
+        RollingNumber(1000, 10, rollups=[(6500, 10)])
+
+    counter = RollingNumber(1000, 10, rollups=[(6000, 6)])
+    with pytest.raises(Exception):
+        counter.rolling_sum(RollingNumberEvent.SUCCESS, 60000)
+
+
+def test_persisted_cumulative_sum(tmpdir):
+    path = str(tmpdir.join('counter'))
+    _time = MockedTime()
+    counter = RollingNumber(200, 10, _time=_time, path=path)
+
+    counter.add(RollingNumberEvent.SUCCESS, 3)
+    counter.update_rolling_max(RollingNumberEvent.THREAD_MAX_ACTIVE, 7)
+    _time.increment(counter.buckets_size_in_milliseconds())
+    counter.increment(RollingNumberEvent.SUCCESS)
+
+    # Rolled out buckets are persisted as they roll
+    counter = RollingNumber(200, 10, _time=_time, path=path)
+    assert counter.cumulative_sum(RollingNumberEvent.SUCCESS) == 3
+    assert counter.cumulative_sum(RollingNumberEvent.THREAD_MAX_ACTIVE) == 7
+    assert counter.rolling_sum(RollingNumberEvent.SUCCESS) == 0
+
+    # The current bucket once flushed
+    counter.increment(RollingNumberEvent.SUCCESS)
+    counter.flush()
+    counter = RollingNumber(200, 10, _time=_time, path=path)
+    assert counter.cumulative_sum(RollingNumberEvent.SUCCESS) == 4
+
+    # But not twice once it rolled out
+    counter.increment(RollingNumberEvent.SUCCESS)
+    counter.flush()
+    _time.increment(counter.buckets_size_in_milliseconds())
+    assert counter.cumulative_sum(RollingNumberEvent.SUCCESS) == 5
+    counter = RollingNumber(200, 10, _time=_time, path=path)
+    assert counter.cumulative_sum(RollingNumberEvent.SUCCESS) == 5
+
+
+def test_persisted_cumulative_sum_ignores_unreadable_file(tmpdir):
+    path = tmpdir.join('counter')
+    path.write('garbage')
+
+    counter = RollingNumber(200, 10, _time=MockedTime(), path=str(path))
+    assert counter.cumulative_sum(RollingNumberEvent.SUCCESS) == 0
+    counter.increment(RollingNumberEvent.SUCCESS)
+    assert counter.cumulative_sum(RollingNumberEvent.SUCCESS) == 1
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires fork')
+def test_persisted_cumulative_sum_is_not_shared_with_children(tmpdir):
+    path = str(tmpdir.join('counter'))
+    _time = MockedTime()
+    counter = RollingNumber(200, 10, _time=_time, path=path)
+    counter.add(RollingNumberEvent.SUCCESS, 3)
+    _time.increment(counter.buckets_size_in_milliseconds())
+    counter.current_bucket()
+
+    pid = os.fork()
+    if pid == 0:
+        # Rolls into a private copy and doesn't flush
+        counter.add(RollingNumberEvent.SUCCESS, 100)
+        _time.increment(counter.buckets_size_in_milliseconds())
+        counter.current_bucket()
+        counter.flush()
+        os._exit(0 if counter.cumulative_sum(
+            RollingNumberEvent.SUCCESS) == 103 else 1)
+
+    assert os.waitpid(pid, 0)[1] == 0
+    assert counter.cumulative_sum(RollingNumberEvent.SUCCESS) == 3
+    assert RollingNumber(200, 10, _time=_time, path=path).cumulative_sum(
+        RollingNumberEvent.SUCCESS) == 3
+
+
+def test_persisted_rolling_number_can_be_collected(tmpdir):
+    counter = RollingNumber(200, 10, _time=MockedTime(),
+                            path=str(tmpdir.join('counter')))
+    reference = weakref.ref(counter)
+    del counter
+    gc.collect()
+    assert reference() is None
+
+
+def test_event_types_are_checked():
+    counter = RollingNumber(200, 10, _time=MockedTime())
+
+    with pytest.raises(Exception) as error:
+        counter.increment(RollingNumberEvent.THREAD_MAX_ACTIVE)
+    assert 'LongAdder' in str(error.value)
+
+    with pytest.raises(Exception):
+        counter.add(RollingNumberEvent.THREAD_MAX_ACTIVE, 2)
+
+    with pytest.raises(Exception) as error:
+        counter.update_rolling_max(RollingNumberEvent.SUCCESS, 50)
+    assert 'LongMaxUpdater' in str(error.value)
+
+    with pytest.raises(Exception):
+        counter.rolling_sum(RollingNumberEvent.THREAD_MAX_ACTIVE)
+
+    assert counter.rolling_sum(RollingNumberEvent.SUCCESS) == 0
+    assert counter.rolling_max(RollingNumberEvent.THREAD_MAX_ACTIVE) == 0
+
+
+def test_foreign_events_are_rejected():
+    class CacheEvent(six.with_metaclass(EventMetaclass, object)):
+        HITS = 1
+        SIZE = 2
+
+    counter = RollingNumber(200, 10, _time=MockedTime(), events=CacheEvent)
+    for record in (lambda: counter.increment(RollingNumberEvent.SUCCESS),
+                   lambda: counter.increment(RollingNumberEvent.TIMEOUT),
+                   lambda: counter.update_rolling_max(
+                       RollingNumberEvent.FAILURE, 3),
+                   lambda: counter.record_many(
+                       {RollingNumberEvent.SUCCESS: 1}),
+                   lambda: counter.rolling_max(RollingNumberEvent.FAILURE)):
+        with pytest.raises(Exception) as error:
+            record()
+        assert 'not a member of CacheEvent' in str(error.value)
+    assert counter.rolling_sum(CacheEvent.HITS) == 0
+
+    # Custom events of sibling classes share ordinals
+    First = RollingNumberEvent.extend('First', counters=['X'])
+    Second = RollingNumberEvent.extend('Second', counters=['Y'])
+    assert First.X.ordinal == Second.Y.ordinal
+    counter = RollingNumber(200, 10, _time=MockedTime(), events=First)
+    with pytest.raises(Exception):
+        counter.increment(Second.Y)
+    counter.increment(First.SUCCESS)
+    assert counter.rolling_sum(First.X) == 0
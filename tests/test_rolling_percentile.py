@@ -1,9 +1,18 @@
+import multiprocessing
+import threading
+
 import pytest
 
 from .utils import MockedTime
 from .sample_data import sample_data_holder_1, sample_data_holder_2
 
-from hystrix.rolling_percentile import RollingPercentile, PercentileSnapshot
+from hystrix.rolling_percentile import (RollingPercentile, PercentileSnapshot,
+                                        HistogramBucketData, Bucket,
+                                        PercentileBucketData,
+                                        ReservoirBucketData,
+                                        SharedPercentileBucketData,
+                                        SketchBucketData, SketchSnapshot)
+from hystrix.sketch import DDSketch
 
 
 def test_rolling():
@@ -255,3 +264,321 @@ def test_does_nothing_when_disabled():
     assert percentile.percentile(50) == -1
     assert percentile.percentile(75) == -1
     assert percentile.mean() == -1
+
+
+def histogram_for_values(*values):
+    bucket = Bucket(0, None, HistogramBucketData)
+    bucket.data.add_value(*values)
+    return HistogramBucketData.snapshot_class(bucket)
+
+
+def test_histogram_relative_error():
+    values = [1, 2, 3, 127, 128, 129, 1000, 65537, 999999, 2 ** 31 - 1]
+    for value in values:
+        index = HistogramBucketData.index(value)
+        assert abs(HistogramBucketData.value_at(index) - value) <= \
+            value / 64.0
+
+    # Indexes are contiguous and increasing
+    indexes = [HistogramBucketData.index(value) for value in range(5000)]
+    assert indexes == sorted(indexes)
+    assert len(set(indexes)) == indexes[-1] + 1
+
+
+def test_histogram_percentiles():
+    snapshot = histogram_for_values(100, 100, 100, 100, 200, 200,
+                                    200, 300, 300, 300, 300)
+    # Within the relative error of the value
+    assert snapshot.percentile(50) == 200
+    assert snapshot.percentile(0) == 100
+    assert abs(snapshot.percentile(100) - 300) <= 300 / 64.0
+    assert snapshot.mean() == 200
+
+    snapshot = histogram_for_values(-5, 2 ** 40)
+    assert snapshot.percentile(0) == 0
+    assert snapshot.percentile(100) >= (2 ** 31 - 1) * 63 / 64
+
+    assert histogram_for_values().percentile(50) == 0
+
+
+def test_histogram_sample_data_over_time():
+    time = MockedTime()
+    percentile = RollingPercentile(time, 60000, 12, 1000, True,
+                                   bucket_data=HistogramBucketData)
+    previous_time = 0
+    for time_millis, latency in sample_data_holder_2:
+        time.increment(time_millis - previous_time)
+        previous_time = time_millis
+        percentile.add_value(latency)
+
+    assert 50 <= percentile.percentile(50) <= 90
+    assert percentile.percentile(99) >= 400
+
+
+def test_snapshot_is_built_on_read():
+    time = MockedTime()
+    percentile = RollingPercentile(time, 60000, 12, 1000, True)
+    percentile.add_value(1000)
+    time.increment(5000)
+    percentile.add_value(2000)
+
+    # Rolled but nobody read yet
+    assert percentile._snapshot_buckets is not None
+    snapshot = percentile.current_percentile_snapshot()
+    assert percentile._snapshot_buckets is None
+    assert snapshot.percentile(50) == 1000
+
+    # Cached until the next roll
+    assert percentile.current_percentile_snapshot() is snapshot
+    time.increment(5000)
+    assert percentile.percentile(100) == 2000
+
+
+def test_reset_after_rolling_window_passes():
+    time = MockedTime()
+    percentile = RollingPercentile(time, 60000, 12, 1000, True)
+    percentile.add_value(1000)
+    time.increment(5000)
+    percentile.add_value(1000)
+
+    time.increment(120000)
+    percentile.add_value(10)
+    assert percentile.buckets.size == 1
+    assert percentile.percentile(50) == 0
+
+
+def test_snapshot_with_and_without_numpy(monkeypatch):
+    pytest.importorskip('numpy')
+    import hystrix.rolling_percentile
+
+    buckets = [Bucket(0, 100) for _ in range(3)]
+    for index, bucket in enumerate(buckets):
+        bucket.data.add_value(*range(index, 150, 3))
+
+    with_numpy = PercentileSnapshot(*buckets)
+    monkeypatch.setattr(hystrix.rolling_percentile, 'numpy', None)
+    without_numpy = PercentileSnapshot(*buckets)
+
+    assert with_numpy.length == without_numpy.length == 150
+    assert with_numpy.mean() == without_numpy.mean()
+    for percent in (0, 0.5, 25, 50, 90, 99.5, 100):
+        assert with_numpy.percentile(percent) == \
+            without_numpy.percentile(percent)
+
+
+def test_snapshot_keeps_zero_values_first():
+    snapshot = percentile_for_values(0, 0, 5, 10)
+    assert snapshot.percentile(0) == 0
+    assert snapshot.percentile(50) == 5
+    assert snapshot.percentile(100) == 10
+
+
+def test_bucket_data_keeps_latest_values():
+    data = PercentileBucketData(4)
+    data.add_value(1, 2, 3)
+    assert data.length() == 3
+    assert list(data.values()) == [1, 2, 3]
+
+    # Wraps around, keeping the most recent values
+    data.add_value(4, 5, 6)
+    assert data.length() == 4
+    assert sorted(data.values()) == [3, 4, 5, 6]
+
+
+def test_bucket_data_positions_are_claimed_once():
+    data = PercentileBucketData(4000)
+
+    def record(value):
+        for _ in range(1000):
+            data.add_value(value)
+
+    threads = [threading.Thread(target=record, args=(value,))
+               for value in range(1, 5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    values = list(data.values())
+    assert len(values) == 4000
+    assert sorted(values.count(value) for value in range(1, 5)) == \
+        [1000] * 4
+
+
+def test_shared_bucket_data():
+    time = MockedTime()
+    percentile = RollingPercentile(time, 60000, 12, 1000, True,
+                                   bucket_data=SharedPercentileBucketData)
+    percentile.add_value(10, 20, 30)
+    time.increment(5000)
+
+    assert percentile.percentile(100) == 30
+    assert percentile.mean() == 20
+
+
+def test_shared_bucket_data_across_processes():
+    data = SharedPercentileBucketData(6)
+    data.add_value(1, 2)
+
+    context = multiprocessing.get_context('fork')
+    process = context.Process(target=data.add_value, args=(7, 8, 9))
+    process.start()
+    process.join(10)
+    assert process.exitcode == 0
+
+    assert data.length() == 5
+    assert sorted(data.values()) == [1, 2, 7, 8, 9]
+    data.add_value(3)
+    assert sorted(data.values()) == [1, 2, 3, 7, 8, 9]
+
+
+def test_reservoir_samples_the_whole_bucket():
+    data = ReservoirBucketData(1000)
+    data.add_value(*range(100000))
+
+    values = data.values()
+    assert data.length() == 1000
+    assert len(set(values)) == 1000
+    # Spread over the whole interval rather than its last 1000 values
+    assert min(values) < 10000
+    assert 40000 < sum(values) / len(values) < 60000
+
+    percentile = RollingPercentile(MockedTime(), 60000, 12, 1000, True,
+                                   bucket_data=ReservoirBucketData)
+    percentile.add_value(*range(100000))
+    percentile.time.increment(5000)
+    assert 90000 < percentile.percentile(95) < 99000
+
+
+def test_sketch_bucket_data_merges_across_processes():
+    workers = []
+    for offset in (0, 1):
+        time = MockedTime()
+        percentile = RollingPercentile(time, 60000, 12, 1000, True,
+                                       bucket_data=SketchBucketData)
+        percentile.add_value(*range(offset, 1000, 2))
+        time.increment(5000)
+        percentile.current_bucket()
+        workers.append(percentile.current_percentile_snapshot().to_bytes())
+
+    sketch = DDSketch.from_bytes(workers[0])
+    sketch.merge(DDSketch.from_bytes(workers[1]))
+    snapshot = SketchSnapshot.from_sketch(sketch)
+
+    assert snapshot.length == 1000
+    assert abs(snapshot.percentile(99) - 989) <= 10
+    assert abs(snapshot.percentile(50) - 499) <= 5
+    assert snapshot.mean() == 499
+
+
+@pytest.mark.parametrize('bucket_data', [PercentileBucketData,
+                                         HistogramBucketData,
+                                         SketchBucketData])
+def test_percentiles(bucket_data):
+    time = MockedTime()
+    percentile = RollingPercentile(time, 60000, 12, 1000, True,
+                                   bucket_data=bucket_data)
+    percentile.add_value(*range(1, 101))
+    time.increment(5000)
+
+    summary = percentile.percentiles([99, 50, 90, 100])
+    assert summary.percentiles() == dict(
+        (p, percentile.percentile(p)) for p in (99, 50, 90, 100))
+    assert abs(summary.percentile(50) - 50) <= 1
+    assert abs(summary.percentile(99) - 99) <= 1
+    assert summary.mean() == percentile.mean()
+    assert summary.min() == 1
+    assert summary.max() == 100
+
+
+def test_percentiles_when_disabled_or_empty():
+    percentile = RollingPercentile(MockedTime(), 60000, 12, 1000, False)
+    summary = percentile.percentiles([50, 99])
+    assert summary.percentile(99) == -1
+    assert summary.max() == -1
+
+    snapshot = HistogramBucketData.snapshot_class()
+    assert snapshot.percentiles([50, 99]) == [0, 0]
+
+
+@pytest.mark.parametrize('bucket_data', [PercentileBucketData,
+                                         SharedPercentileBucketData,
+                                         HistogramBucketData])
+def test_sub_millisecond_durations(bucket_data):
+    time = MockedTime()
+    percentile = RollingPercentile(time, 60000, 12, 1000, True,
+                                   bucket_data=bucket_data,
+                                   unit='microseconds')
+    percentile.add_duration(0.0002, 0.0005, 0.0008)
+    time.increment(5000)
+
+    summary = percentile.percentiles([0, 100])
+    assert abs(summary.percentile(0) - 200) <= 2
+    assert abs(summary.percentile(100) - 800) <= 8
+
+
+def test_values_above_32_bits():
+    time = MockedTime()
+    percentile = RollingPercentile(time, 60000, 12, 1000, True,
+                                   unit='nanoseconds')
+    # 5 and 10 seconds in nanoseconds
+    percentile.add_duration(5, 10)
+    time.increment(5000)
+
+    assert percentile.percentile(0) == 5 * 10 ** 9
+    assert percentile.percentile(100) == 10 * 10 ** 9
+    assert percentile.mean() == 7500000000
+
+
+def test_unknown_unit():
+    with pytest.raises(ValueError):
+        RollingPercentile(MockedTime(), 60000, 12, 1000, True, unit='hours')
+
+
+@pytest.mark.parametrize('precision', [4, 10])
+def test_histogram_precision(precision):
+    class Histogram(HistogramBucketData):
+        pass
+
+    Histogram.precision = precision
+    error = 2.0 ** (1 - precision)
+
+    time = MockedTime()
+    percentile = RollingPercentile(time, 60000, 12, 1000, True,
+                                   bucket_data=Histogram)
+    percentile.add_value(*range(1, 5000))
+    time.increment(5000)
+
+    summary = percentile.percentiles([50, 99])
+    assert abs(summary.percentile(50) - 2500) <= 2500 * error
+    assert abs(summary.percentile(99) - 4950) <= 4950 * error
+
+    percentile.reset()
+    percentile.add_value(1000, 1000, 1000)
+    time.increment(5000)
+    assert abs(percentile.percentile(50) - 1000) <= 1000 * error
+
+
+def test_bucket_data_length_counts_completed_writes():
+    data = PercentileBucketData(4)
+    assert data.length() == 0
+    data.add_value(1, 2, 3)
+    assert data.length() == 3
+    data.add_value(4, 5, 6)
+    assert data.length() == 4
+    assert sorted(data.values()) == [3, 4, 5, 6]
+
+
+def test_sketch_relative_accuracy():
+    class Sketch(SketchBucketData):
+        relative_accuracy = 0.05
+
+    time = MockedTime()
+    percentile = RollingPercentile(time, 60000, 12, 1000, True,
+                                   bucket_data=Sketch)
+    percentile.add_value(*range(1, 1001))
+    time.increment(5000)
+
+    assert abs(percentile.percentile(50) - 500) <= 500 * 0.05
+    assert percentile.current_percentile_snapshot().sketch \
+        .relative_accuracy == 0.05
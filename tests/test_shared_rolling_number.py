@@ -0,0 +1,142 @@
+import multiprocessing
+import threading
+import pickle
+import uuid
+
+import pytest
+
+from hystrix.rolling_number import RollingNumberEvent
+from hystrix.shared_rolling_number import (SharedRollingNumber,
+                                           shared_memory, fcntl)
+
+from .utils import MockedTime
+
+pytestmark = pytest.mark.skipif(
+    shared_memory is None or fcntl is None,
+    reason='requires multiprocessing.shared_memory and fcntl')
+
+
+@pytest.fixture
+def counter():
+    counter = SharedRollingNumber('hystrix-{}'.format(uuid.uuid4().hex[:8]),
+                                  10000, 10, slots=4)
+    yield counter
+    counter.close()
+    counter.unlink()
+
+
+def record(counter, count, active):
+    for _ in range(count):
+        counter.increment(RollingNumberEvent.SUCCESS)
+    counter.record_many({RollingNumberEvent.FAILURE: 1,
+                         RollingNumberEvent.THREAD_MAX_ACTIVE: active})
+
+
+def test_processes_share_counters(counter):
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=record, args=(counter, 100, active))
+                 for active in (3, 8)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    record(counter, 10, 5)
+
+    assert counter.rolling_sum(RollingNumberEvent.SUCCESS) == 210
+    assert counter.rolling_sum(RollingNumberEvent.FAILURE) == 3
+    assert counter.rolling_max(RollingNumberEvent.THREAD_MAX_ACTIVE) == 8
+    assert counter.value_of_latest_bucket(RollingNumberEvent.SUCCESS) == 210
+
+    snapshot = counter.snapshot([RollingNumberEvent.SUCCESS])
+    assert snapshot.rolling_sum(RollingNumberEvent.SUCCESS) == 210
+    assert snapshot.cumulative_sum(RollingNumberEvent.SUCCESS) == 210
+
+
+def test_attach_by_name(counter):
+    attached = pickle.loads(pickle.dumps(counter))
+    attached.increment(RollingNumberEvent.SUCCESS)
+    assert counter.rolling_sum(RollingNumberEvent.SUCCESS) == 1
+    attached.close()
+
+    with pytest.raises(Exception):
+        SharedRollingNumber(counter.name, 10000, 20, slots=4)
+
+
+def test_buckets_roll():
+    _time = MockedTime()
+    counter = SharedRollingNumber('hystrix-{}'.format(uuid.uuid4().hex[:8]),
+                                  200, 10, slots=2, _time=_time)
+    try:
+        counter.add(RollingNumberEvent.SUCCESS, 3)
+        _time.increment(counter.buckets_size_in_milliseconds())
+        counter.add(RollingNumberEvent.SUCCESS, 2)
+        assert counter.values(RollingNumberEvent.SUCCESS)[:2] == [2, 3]
+        assert counter.rolling_sum(RollingNumberEvent.SUCCESS) == 5
+
+        # Past the window, the buckets are only folded once reused
+        _time.increment(200)
+        assert counter.rolling_sum(RollingNumberEvent.SUCCESS) == 0
+        counter.increment(RollingNumberEvent.SUCCESS)
+        assert counter.rolling_sum(RollingNumberEvent.SUCCESS) == 1
+        assert counter.cumulative_sum(RollingNumberEvent.SUCCESS) == 6
+
+        counter.reset()
+        assert counter.rolling_sum(RollingNumberEvent.SUCCESS) == 0
+        assert counter.cumulative_sum(RollingNumberEvent.SUCCESS) == 6
+    finally:
+        counter.close()
+        counter.unlink()
+
+
+def record_from_threads(counter):
+    threads = [threading.Thread(target=record, args=(counter, 100, 1))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_forked_child_threads_claim_one_slot(counter):
+    context = multiprocessing.get_context('fork')
+
+    # A lock held by a parent thread while forking isn't held in the child
+    with counter._lock:
+        process = context.Process(target=record_from_threads,
+                                  args=(counter,))
+        process.start()
+    process.join(10)
+
+    assert process.exitcode == 0
+    assert counter.rolling_sum(RollingNumberEvent.SUCCESS) == 400
+    owners = [counter._view[slot * counter._block]
+              for slot in range(counter.slots)]
+    assert owners.count(0) == counter.slots - 1
+
+
+def test_custom_events():
+    CacheEvent = RollingNumberEvent.extend('CacheEvent',
+                                           counters=['CACHE_HIT'])
+    counter = SharedRollingNumber('hystrix-{}'.format(uuid.uuid4().hex[:8]),
+                                  10000, 10, slots=2, events=CacheEvent)
+    try:
+        counter.increment(CacheEvent.CACHE_HIT)
+        counter.increment(RollingNumberEvent.SUCCESS)
+        assert counter.rolling_sum(CacheEvent.CACHE_HIT) == 1
+        assert counter.rolling_sum(RollingNumberEvent.SUCCESS) == 1
+
+        # The default events don't match the segment
+        with pytest.raises(Exception):
+            SharedRollingNumber(counter.name, 10000, 10, slots=2)
+    finally:
+        counter.close()
+        counter.unlink()
+
+
+def test_foreign_events_are_rejected(counter):
+    Other = RollingNumberEvent.extend('Other', counters=['Y'])
+
+    with pytest.raises(Exception):
+        counter.increment(Other.Y)
+    with pytest.raises(Exception):
+        counter.rolling_sum(Other.Y)
@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+from hystrix.sketch import DDSketch
+
+
+def exact_quantile(values, quantile):
+    values = sorted(values)
+    return values[int(quantile * (len(values) - 1))]
+
+
+def test_relative_accuracy():
+    values = [random.lognormvariate(3, 1.5) for _ in range(10000)]
+    sketch = DDSketch(0.01)
+    for value in values:
+        sketch.add(value)
+
+    assert sketch.count == 10000
+    for quantile in (0.01, 0.5, 0.9, 0.99, 0.999):
+        exact = exact_quantile(values, quantile)
+        assert abs(sketch.quantile(quantile) - exact) <= exact * 0.01
+
+
+def test_merge_is_exact():
+    values = [random.randint(0, 5000) for _ in range(3000)]
+    whole = DDSketch()
+    parts = [DDSketch() for _ in range(3)]
+    for index, value in enumerate(values):
+        whole.add(value)
+        parts[index % 3].add(value)
+
+    merged = DDSketch()
+    for part in parts:
+        merged.merge(part)
+
+    assert merged.bins == whole.bins
+    assert merged.zero_count == whole.zero_count
+    assert merged.quantile(0.99) == whole.quantile(0.99)
+
+    with pytest.raises(ValueError):
+        merged.merge(DDSketch(0.05))
+
+
+def test_bytes_round_trip():
+    sketch = DDSketch(0.02)
+    sketch.add(0, 3)
+    for value in (1, 10, 100, 1000):
+        sketch.add(value)
+
+    data = sketch.to_bytes()
+    assert len(data) < 100
+
+    loaded = DDSketch.from_bytes(data)
+    assert loaded.relative_accuracy == 0.02
+    assert loaded.bins == sketch.bins
+    assert loaded.count == sketch.count == 7
+    assert loaded.mean() == sketch.mean()
+    assert loaded.quantile(0) == 0
+
+    with pytest.raises(ValueError):
+        DDSketch.from_bytes(data[:-1])
+    with pytest.raises(ValueError):
+        DDSketch.from_bytes(b'HX')